@@ -1,31 +1,67 @@
+import asyncio
+import email.utils
 import requests
+import httpx
+import numpy as np
 import config
-from typing import Dict, Optional, List
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Callable, Dict, Optional, List
 import logging
 import re
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import threading
+import time
+
+from models import ProductInfo, BarcodeLookup, intern_text
+from product_cache import PersistentProductCache, ProductCache, MISSING, is_negative_result
+from resilience import (
+    SingleFlight, AsyncSingleFlight, LatencyTracker, CircuitBreaker, CircuitOpenError,
+    PriorityRateLimiter, RateLimitTimeout
+)
+from product_index import LocalProductIndex, TrigramIndex
+from product_resolver import ResolverChain, ResolverTier, parse_chain, parse_timeouts
+from product_store import LocalProductStore
+from barcode_index import BarcodeIndex
+from nutrient_table import NutrientTable, SIMILARITY_COLUMNS
+from text_utils import KeywordMatcher, normalize_query, query_key, unit_grams
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class ProductInfo:
-    """Информация о продукте"""
-    name: str
-    calories: float
-    protein: float
-    fat: float
-    carbs: float
-    fiber: Optional[float] = None
-    sugar: Optional[float] = None
-    salt: Optional[float] = None
-    serving_size_g: float = 100
-    source: str = "openfoodfacts"
-    success: bool = True
-    barcode: Optional[str] = None
-    brands: Optional[str] = None
-    categories: Optional[str] = None
-    nova_group: Optional[int] = None  # 1-4 (1 - минимальная обработка, 4 - ультраобработанный)
+DEFAULT_HEADERS = {
+    'User-Agent': 'SlimTrackerBot/1.0 (Telegram Bot)',
+    'Accept': 'application/json'
+}
+
+# Штрих-код заведомо существующего продукта для проверки доступности сервиса
+PING_BARCODE = '3017620422003'
+
+# Поля продукта, которые читает _parse_product_data: остальное
+# (состав, картинки, упаковку) Open Food Facts не присылает
+PRODUCT_FIELDS = ','.join((
+    'code', 'product_name', 'product_name_ru', 'generic_name', 'generic_name_ru',
+    'brands', 'categories', 'nutriments', 'nova_group',
+))
+
+# Ключевые слова для оценки категории продукта
+CATEGORY_KEYWORDS = {
+    'фрукт': ['фрукт', 'ягод', 'абрикос', 'вишн', 'груш', 'персик', 'слив'],
+    'овощ': ['овощ', 'огур', 'помидор', 'картош', 'морков', 'капуст', 'лук'],
+    'мясо': ['мясо', 'говядин', 'свинин', 'баран', 'курин', 'индейк'],
+    'рыба': ['рыба', 'лосос', 'форел', 'тунец', 'селед', 'скумбр'],
+    'молочный': ['молок', 'кефир', 'йогурт', 'творог', 'сыр', 'сметан'],
+    'крупа': ['рис', 'гречк', 'овсян', 'перлов', 'пшен', 'макарон'],
+    'хлеб': ['хлеб', 'булк', 'батон', 'бухан', 'лаваш'],
+    'сладость': ['шоколад', 'конфет', 'печень', 'торт', 'пирож', 'морожен'],
+    'напиток': ['сок', 'компот', 'лимонад', 'кола', 'пепси', 'напиток'],
+}
+CATEGORY_MATCHER = KeywordMatcher(CATEGORY_KEYWORDS)
+
+# Питательные вещества в итогах анализа приема пищи
+MEAL_NUTRIENTS = ('calories', 'protein', 'fat', 'carbs')
+
+# Масштаб SIMILARITY_COLUMNS при поиске похожих продуктов: разница
+# в 100 ккал весит как 10 г белков, жиров, углеводов или сахара и 3 г клетчатки
+SIMILARITY_SCALE = np.array([100, 10, 10, 10, 3, 10], dtype=np.float32)
 
 class OpenFoodFactsAPI:
     """Клиент для работы с Open Food Facts API"""
@@ -33,20 +69,189 @@ class OpenFoodFactsAPI:
     def __init__(self):
         self.base_url = "https://world.openfoodfacts.org"
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'SlimTrackerBot/1.0 (Telegram Bot)',
-            'Accept': 'application/json'
-        })
+        self.session.headers.update(DEFAULT_HEADERS)
+        
+        # Локальная база: матрица float32 (продукты x питательные вещества) и индекс название -> строка
+        self.local_db = self._build_local_table(self._init_local_database())
+        self.local_index = LocalProductIndex(self.local_db.keys())
+        
+        # Нечеткий поиск: по локальной базе и по уже полученным из сети продуктам
+        self.local_fuzzy = TrigramIndex()
+        for product_name in self.local_db.keys():
+            self.local_fuzzy.add(product_name, self._local_product(product_name, 'local_db_fuzzy'))
+        # Продукты, полученные из сети: компактная таблица и нечеткий индекс ключей к ней
+        self.catalog = NutrientTable(max_rows=config.Config.OPENFOODFACTS_CACHE_MAX_ENTRIES)
+        # Похожие запросы отдаются, только пока не истек срок жизни результатов поиска
+        self.cached_fuzzy = TrigramIndex(
+            max_entries=config.Config.OPENFOODFACTS_CACHE_MAX_ENTRIES,
+            max_age_seconds=config.Config.OPENFOODFACTS_CACHE_HOURS * 3600
+        )
+        self.fuzzy_threshold = config.Config.FUZZY_MATCH_THRESHOLD
+        
+        # Кэш запросов (ограниченный LRU со сроками жизни по типу записи)
+        self.cache = ProductCache(
+            max_entries=config.Config.OPENFOODFACTS_CACHE_MAX_ENTRIES,
+            ttl_seconds={
+                'search': config.Config.OPENFOODFACTS_CACHE_HOURS * 3600,
+                'barcode': config.Config.OPENFOODFACTS_BARCODE_CACHE_HOURS * 3600,
+                'negative': config.Config.OPENFOODFACTS_NEGATIVE_CACHE_MINUTES * 60,
+            },
+            max_stale_seconds=config.Config.OPENFOODFACTS_CACHE_MAX_STALE_HOURS * 3600
+        )
         
-        # Локальная кэш-база для популярных продуктов
-        self.local_db = self._init_local_database()
+        # Постоянный кэш на диске, переживает перезапуски
+        self.persistent_cache = PersistentProductCache(
+            config.Config.OPENFOODFACTS_CACHE_PATH,
+            default_ttl_seconds=config.Config.OPENFOODFACTS_PERSISTENT_CACHE_HOURS * 3600
+        )
+        
+        # Локальная копия дампа Open Food Facts (если импортирована)
+        self.product_store = LocalProductStore.open_if_exists(
+            config.Config.OPENFOODFACTS_PRODUCT_STORE_PATH
+        )
+        self.barcode_index = BarcodeIndex.open_if_exists(
+            config.Config.OPENFOODFACTS_BARCODE_INDEX_PATH
+        )
+        
+        # Одинаковые одновременные запросы разделяют один вызов Open Food Facts
+        self._flights = SingleFlight()
         
-        # Кэш запросов
-        self.cache = {}
-        self.cache_expiry = timedelta(hours=1)
+        # Фоновое обновление устаревших записей кэша (stale-while-revalidate)
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=config.Config.OPENFOODFACTS_REVALIDATE_CONCURRENCY,
+            thread_name_prefix='off-revalidate'
+        )
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
+        self.revalidations = 0
+        
+        # Ограничения частоты Open Food Facts: отдельно для поиска и для продуктов
+        self.search_limiter = PriorityRateLimiter(
+            config.Config.OPENFOODFACTS_SEARCH_RATE_PER_MINUTE / 60,
+            burst=config.Config.OPENFOODFACTS_RATE_BURST
+        )
+        self.product_limiter = PriorityRateLimiter(
+            config.Config.OPENFOODFACTS_PRODUCT_RATE_PER_MINUTE / 60,
+            burst=config.Config.OPENFOODFACTS_RATE_BURST
+        )
+        
+        # Адаптивные таймауты и автомат защиты на случай деградации Open Food Facts
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            failure_threshold=config.Config.OPENFOODFACTS_CIRCUIT_FAILURES,
+            reset_timeout=config.Config.OPENFOODFACTS_CIRCUIT_RESET_SECONDS
+        )
+        
+        # Цепочка источников для get_product_info: дешевые уровни первыми
+        self.resolver = self._build_resolver(
+            parse_chain(config.Config.PRODUCT_RESOLVER_CHAIN),
+            parse_timeouts(config.Config.PRODUCT_RESOLVER_TIMEOUTS)
+        )
+    
+    def _cache_get(self, cache_key: str, refresh: Optional[Callable] = None):
+        """
+        Поиск в кэше: сначала в памяти, затем на диске
+        
+        Устаревшая запись отдается сразу, а refresh (повторный запрос
+        в Open Food Facts) запускается в фоне.
+        """
+        cached_data, stale = self.cache.get_with_state(cache_key)
+        if cached_data is MISSING:
+            cached_data, stale = self._persistent_get(cache_key)
+            if cached_data is MISSING:
+                return MISSING
+        
+        if stale and refresh is not None:
+            self._schedule_refresh(cache_key, refresh)
+        return cached_data
+    
+    def _persistent_get(self, cache_key: str):
+        """
+        Запись с диска по тем же срокам, что и в памяти: (значение, устарело ли)
+        
+        Диск хранит записи дольше, но запись старше срока жизни типа
+        отдается как устаревшая, а старше предела устаревания - не
+        отдается вовсе, чтобы ее запросили заново.
+        """
+        cached_data, age = self.persistent_cache.get_with_age(cache_key)
+        if cached_data is MISSING:
+            return MISSING, False
+        
+        ttl = self.cache.ttl_for(cache_key, cached_data)
+        max_stale = 0 if is_negative_result(cached_data) else self.cache.max_stale_seconds
+        if age >= ttl + max_stale:
+            return MISSING, False
+        
+        self.cache.put(cache_key, cached_data, ttl - age)
+        return cached_data, age >= ttl
+    
+    def _schedule_refresh(self, cache_key: str, refresh: Callable):
+        """Фоновое обновление устаревшей записи (не более одного на ключ)"""
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+        
+        self.revalidations += 1
+        self._refresh_executor.submit(self._revalidate, cache_key, refresh)
+    
+    def _revalidate(self, cache_key: str, refresh: Callable):
+        try:
+            refresh()
+        except Exception as e:
+            logger.warning(f"Background refresh of {cache_key} failed: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(cache_key)
+    
+    def _search_store(self, query: str, cache_key: str, limit: int) -> Optional[List[ProductInfo]]:
+        """Поиск в импортированном дампе; найденное кладется в кэш в памяти"""
+        if self.product_store is None:
+            return None
+        
+        products = self.product_store.search(query, limit)
+        if not products:
+            return None
+        
+        self.cache.put(cache_key, products)
+        self._remember_products(query, products)
+        return products
+    
+    def _barcode_from_store(self, barcode: str, cache_key: str) -> Optional[ProductInfo]:
+        """Продукт по штрих-коду из импортированного дампа: mmap-индекс, затем SQLite"""
+        product_info = None
+        if self.barcode_index is not None:
+            product_info = self.barcode_index.get(barcode)
+        if product_info is None and self.product_store is not None:
+            product_info = self.product_store.get_by_barcode(barcode)
+        
+        if product_info:
+            self.cache.put(cache_key, product_info)
+        return product_info
+    
+    def _cache_put(self, cache_key: str, value):
+        """Сохранить результат в кэш в памяти и на диске"""
+        self.cache.put(cache_key, value)
+        self._persistent_put(cache_key, value)
+    
+    def _persistent_put(self, cache_key: str, value):
+        # Отрицательные результаты на диске живут так же недолго, как в памяти
+        if is_negative_result(value):
+            self.persistent_cache.put(cache_key, value, self.cache.ttl_for(cache_key, value))
+        else:
+            self.persistent_cache.put(cache_key, value)
+    
+    @staticmethod
+    def _build_local_table(local_db: Dict[str, Dict]) -> NutrientTable:
+        """Уложить локальную базу в компактную таблицу (ключ - название в нижнем регистре)"""
+        table = NutrientTable(initial_capacity=len(local_db))
+        for product_name, nutrients in local_db.items():
+            product_info = ProductInfo(name=product_name.capitalize(), source='local_db', **nutrients)
+            table.add(product_name, product_info, OpenFoodFactsAPI._product_group(product_info))
+        return table
     
     def _init_local_database(self) -> Dict:
-        """Инициализация локальной базы продуктов"""
+        """Исходные данные локальной базы продуктов"""
         return {
             # Фрукты и ягоды
             'яблоко': {'calories': 52, 'protein': 0.3, 'fat': 0.2, 'carbs': 14, 'fiber': 2.4},
@@ -122,6 +327,215 @@ class OpenFoodFactsAPI:
             'соль': {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0, 'fiber': 0},
         }
     
+    def _request_timeout(self) -> float:
+        """Таймаут по наблюдаемым задержкам, не больше OPENFOODFACTS_REQUEST_TIMEOUT"""
+        return self.latency.timeout(
+            config.Config.OPENFOODFACTS_MIN_TIMEOUT,
+            config.Config.OPENFOODFACTS_REQUEST_TIMEOUT
+        )
+    
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Open Food Facts is unavailable, circuit is open")
+    
+    @staticmethod
+    def _retry_after(value: Optional[str]) -> float:
+        """Пауза из заголовка Retry-After (секунды или HTTP-дата), 1 с без заголовка"""
+        seconds = 1.0
+        if value:
+            try:
+                seconds = float(value)
+            except ValueError:
+                try:
+                    seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(seconds, 0.0), config.Config.OPENFOODFACTS_RETRY_AFTER_MAX)
+    
+    def _record_response(self, response, elapsed: float,
+                         limiter: Optional[PriorityRateLimiter] = None):
+        """Учесть ответ в автомате защиты, ограничителе частоты и статистике задержек"""
+        if response.status_code == 429:
+            # Сервис жив, но просит снизить частоту: не успех и не отказ,
+            # следующие запросы ждут Retry-After в очереди ограничителя
+            self.breaker.release_probe()
+            pause = self._retry_after(response.headers.get('Retry-After'))
+            logger.warning(f"Open Food Facts rate limit hit, pausing requests for {pause:.1f}s")
+            if limiter is not None:
+                limiter.pause(pause)
+        elif response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.latency.record(elapsed)
+    
+    def _rate_limit_wait(self, priority: int) -> Optional[float]:
+        """Сколько запрос может ждать очереди: фоновые ждут без ограничения"""
+        if priority == PriorityRateLimiter.BACKGROUND:
+            return None
+        return config.Config.OPENFOODFACTS_RATE_LIMIT_MAX_WAIT
+    
+    def _http_get(self, url: str, params: Optional[Dict] = None,
+                  limiter: Optional[PriorityRateLimiter] = None,
+                  priority: int = PriorityRateLimiter.INTERACTIVE) -> requests.Response:
+        """GET к Open Food Facts с ограничением частоты, адаптивным таймаутом и автоматом защиты"""
+        self._check_circuit()
+        try:
+            if limiter is not None:
+                limiter.acquire(priority, self._rate_limit_wait(priority))
+            started = time.monotonic()
+            response = self.session.get(url, params=params, timeout=self._request_timeout())
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Запрос не дошел до сервиса (очередь ограничителя и т.п.), иначе
+            # пробный вызов полуоткрытого автомата остался бы занятым навсегда
+            self.breaker.release_probe()
+            raise
+        
+        self._record_response(response, time.monotonic() - started, limiter)
+        return response
+    
+    @staticmethod
+    def _search_query(query: str):
+        """
+        Нормализованный запрос и ключ кэша для поиска
+        
+        Регистр, количества, служебные слова и падежные окончания на ключ
+        не влияют: "Гречка", "гречки" и "ГРЕЧКА 200г" - одна запись кэша.
+        """
+        return normalize_query(query) or query.strip(), f"search_{query_key(query)}"
+    
+    def _search_refresh(self, query: str, cache_key: str, limit: int) -> Callable:
+        """Фоновое обновление устаревшего результата поиска"""
+        return lambda: self._flights.do(
+            cache_key, self._fetch_search, query, cache_key, limit, PriorityRateLimiter.BACKGROUND
+        )
+    
+    def _search_request(self, query: str, limit: int):
+        """URL и параметры поискового запроса к Open Food Facts"""
+        url = f"{self.base_url}/cgi/search.pl"
+        params = {
+            'search_terms': query,
+            'search_simple': 1,
+            'action': 'process',
+            'json': 1,
+            'page_size': limit,
+            'fields': PRODUCT_FIELDS,
+            'lc': 'ru'  # Язык - русский
+        }
+        return url, params
+    
+    def _barcode_request(self, barcode: str):
+        """URL и параметры запроса продукта по штрих-коду"""
+        return f"{self.base_url}/api/v2/product/{barcode}.json", {'fields': PRODUCT_FIELDS}
+    
+    def _handle_search_data(self, query: str, cache_key: str, data: Dict) -> List[ProductInfo]:
+        """Разбор ответа поиска и сохранение результатов в кэш"""
+        products = []
+        
+        if data.get('products'):
+            for product_data in data['products']:
+                product_info = self._parse_product_data(product_data)
+                if product_info and product_info.success:
+                    products.append(product_info)
+        
+        # Кэшируем результаты
+        self._cache_put(cache_key, products)
+        self._remember_products(query, products)
+        
+        if products:
+            logger.info(f"Found {len(products)} products for '{query}'")
+        else:
+            logger.warning(f"No products found for '{query}'")
+        
+        return products
+    
+    def _remember_products(self, query: str, products: List[ProductInfo]):
+        """Добавить запрос и названия найденных продуктов в нечеткий индекс"""
+        if not products:
+            return
+        
+        keys = [self._catalog_key(product) for product in products]
+        for key, product in zip(keys, products):
+            self.catalog.add(key, product, self._product_group(product))
+            self.cached_fuzzy.add(product.name, key)
+        self.cached_fuzzy.add(query, keys[0])
+    
+    @staticmethod
+    def _catalog_key(product: ProductInfo) -> str:
+        return product.barcode or f"name_{product.name.lower()}"
+    
+    @staticmethod
+    def _category_of(text: str) -> Optional[str]:
+        """
+        Категория текста по CATEGORY_KEYWORDS или None
+        
+        При нескольких совпадениях - последняя по порядку CATEGORY_KEYWORDS.
+        Одно правило для групп альтернатив и для оценки питательной ценности.
+        """
+        return CATEGORY_MATCHER.last_label(text)
+    
+    @classmethod
+    def _product_group(cls, product: ProductInfo) -> Optional[str]:
+        """Укрупненная категория продукта по CATEGORY_KEYWORDS или None"""
+        return cls._category_of(f"{product.name} {product.categories or ''}")
+    
+    def find_alternatives(self, product: ProductInfo, k: int = 5,
+                          max_calorie_ratio: Optional[float] = None,
+                          same_category: bool = True) -> List[ProductInfo]:
+        """
+        Похожие по составу, но менее калорийные продукты
+        
+        k ближайших соседей по питательным веществам среди локальной базы
+        и продуктов, уже полученных из Open Food Facts, не калорийнее
+        max_calorie_ratio от исходного и при same_category - из той же
+        укрупненной категории. Если категорию продукта определить нельзя,
+        альтернатив нет: иначе воде предлагалась бы соль. Сеть не используется.
+        """
+        if max_calorie_ratio is None:
+            max_calorie_ratio = config.Config.ALTERNATIVES_MAX_CALORIE_RATIO
+        
+        group = self._product_group(product) if same_category else None
+        if same_category and group is None:
+            return []
+        vector = np.array(
+            [np.nan if getattr(product, column) is None else getattr(product, column)
+             for column in SIMILARITY_COLUMNS],
+            dtype=np.float32
+        )
+        max_calories = product.calories * max_calorie_ratio
+        exclude = {product.name.lower(), self._catalog_key(product)}
+        
+        candidates = []
+        for table in (self.local_db, self.catalog):
+            for distance, key in table.nearest(vector, SIMILARITY_SCALE, k, group, max_calories, exclude):
+                candidates.append((distance, table, key))
+        candidates.sort(key=lambda candidate: candidate[0])
+        
+        alternatives = []
+        seen_names = {product.name.lower()}
+        for _, table, key in candidates:
+            alternative = table.get(key)
+            if alternative is None or alternative.name.lower() in seen_names:
+                continue
+            seen_names.add(alternative.name.lower())
+            alternatives.append(alternative)
+            if len(alternatives) == k:
+                break
+        
+        return alternatives
+    
+    def _handle_barcode_data(self, cache_key: str, data: Dict) -> Optional[ProductInfo]:
+        """Разбор ответа по штрих-коду и сохранение результата в кэш"""
+        product_info = None
+        if data.get('status') == 1:  # 1 means product found
+            product_info = self._parse_product_data(data['product'])
+        
+        self._cache_put(cache_key, product_info)
+        return product_info
+    
     def search_product(self, query: str, limit: int = 5) -> List[ProductInfo]:
         """
         Поиск продукта по названию в Open Food Facts
@@ -135,53 +549,113 @@ class OpenFoodFactsAPI:
         """
         try:
             # Проверяем кэш
-            cache_key = f"search_{query.lower()}"
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                if datetime.now() - timestamp < self.cache_expiry:
-                    return cached_data
-            
-            # Поиск через API Open Food Facts
-            url = f"{self.base_url}/cgi/search.pl"
-            params = {
-                'search_terms': query,
-                'search_simple': 1,
-                'action': 'process',
-                'json': 1,
-                'page_size': limit,
-                'lc': 'ru'  # Язык - русский
-            }
-            
-            logger.info(f"Searching Open Food Facts for: {query}")
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            products = []
-            
-            if data.get('products'):
-                for product_data in data['products']:
-                    product_info = self._parse_product_data(product_data)
-                    if product_info and product_info.success:
-                        products.append(product_info)
-            
-            # Кэшируем результаты
-            self.cache[cache_key] = (products, datetime.now())
+            query, cache_key = self._search_query(query)
+            cached_data = self._cache_get(cache_key, self._search_refresh(query, cache_key, limit))
+            if cached_data is not MISSING:
+                return cached_data
             
-            if products:
-                logger.info(f"Found {len(products)} products for '{query}'")
-            else:
-                logger.warning(f"No products found for '{query}'")
+            # Затем в локальной копии дампа
+            stored = self._search_store(query, cache_key, limit)
+            if stored:
+                return stored
             
-            return products
+            # Поиск через API Open Food Facts
+            return self._flights.do(cache_key, self._fetch_search, query, cache_key, limit)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error searching Open Food Facts: {e}")
             return []
+        except (CircuitOpenError, RateLimitTimeout) as e:
+            logger.warning(f"Skipping search for '{query}': {e}")
+            return []
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return []
     
+    def ping(self) -> Optional[str]:
+        """
+        Проверка доступности Open Food Facts запросом мимо кэшей и локальных баз
+        
+        Возвращает название тестового продукта; ошибки сети и HTTP пробрасываются.
+        """
+        url, params = self._barcode_request(PING_BARCODE)
+        response = self._http_get(url, params, self.product_limiter)
+        response.raise_for_status()
+        return response.json().get('product', {}).get('product_name')
+    
+    def warm_up(self, queries: List[str], limit: int = 3) -> Dict[str, float]:
+        """
+        Прогрев кэша поиска списком запросов (например, популярных продуктов)
+        
+        Запросы к Open Food Facts идут с фоновым приоритетом и уступают
+        запросам пользователей. Возвращает статистику и долю запросов,
+        которые теперь обслуживаются без сети (hit_ratio).
+        """
+        stats = {'queries': 0, 'cached': 0, 'fetched': 0, 'empty': 0, 'failed': 0}
+        
+        for query in self._warm_up_queries(queries):
+            stats['queries'] += 1
+            query, cache_key = self._search_query(query)
+            try:
+                if self._cache_get(cache_key) is not MISSING or self._search_store(query, cache_key, limit):
+                    stats['cached'] += 1
+                    continue
+                
+                products = self._flights.do(
+                    cache_key, self._fetch_search, query, cache_key, limit, PriorityRateLimiter.BACKGROUND
+                )
+            except CircuitOpenError as e:
+                logger.warning(f"Cache warm-up stopped: {e}")
+                stats['failed'] += 1
+                break
+            except Exception as e:
+                # Ошибка одного запроса (сеть, разбор ответа, диск) не прерывает прогрев
+                logger.warning(f"Cache warm-up failed for '{query}': {e}")
+                stats['failed'] += 1
+                continue
+            
+            stats['fetched' if products else 'empty'] += 1
+        
+        return self._warm_up_result(stats)
+    
+    def share_state(self, other: 'OpenFoodFactsAPI'):
+        """
+        Использовать кэш в памяти, ограничители частоты и автомат защиты другого клиента
+        
+        Все эти структуры потокобезопасны, поэтому синхронный клиент в
+        фоновом потоке может прогревать кэш асинхронного клиента бота:
+        его фоновые запросы стоят в одной очереди с запросами
+        пользователей и расходуют общий лимит Open Food Facts.
+        """
+        self.cache = other.cache
+        self.catalog = other.catalog
+        self.cached_fuzzy = other.cached_fuzzy
+        self.search_limiter = other.search_limiter
+        self.product_limiter = other.product_limiter
+        self.breaker = other.breaker
+        self.latency = other.latency
+    
+    @staticmethod
+    def _warm_up_queries(queries: List[str]) -> List[str]:
+        """Непустые запросы без повторов (по ключу кэша)"""
+        unique = {}
+        for query in queries:
+            query = (query or '').strip()
+            if query:
+                unique.setdefault(query_key(query), query)
+        return list(unique.values())
+    
+    @staticmethod
+    def _warm_up_result(stats: Dict[str, float]) -> Dict[str, float]:
+        served = stats['cached'] + stats['fetched']
+        stats['hit_ratio'] = served / stats['queries'] if stats['queries'] else 0.0
+        logger.info(
+            f"Cache warm-up: {stats['queries']} queries, {stats['cached']} already cached, "
+            f"{stats['fetched']} fetched, {stats['empty']} empty, {stats['failed']} failed, "
+            f"hit ratio {stats['hit_ratio']:.0%}"
+        )
+        return stats
+    
     def get_product_by_barcode(self, barcode: str) -> Optional[ProductInfo]:
         """
         Получить информацию о продукте по штрих-коду
@@ -192,36 +666,115 @@ class OpenFoodFactsAPI:
         Returns:
             Информация о продукте или None
         """
+        lookup = self._barcode_offline(barcode) or self._barcode_online(barcode)
+        return lookup.product
+    
+    def get_products_by_barcodes(self, barcodes: List[str],
+                                 max_concurrency: Optional[int] = None) -> List[BarcodeLookup]:
+        """
+        Получить продукты по списку штрих-кодов (например, из чека)
+        
+        Попадания в кэш и локальную базу отдаются сразу, промахи
+        запрашиваются параллельно, не более max_concurrency одновременно.
+        
+        Returns:
+            Результаты в порядке входного списка, со статусом для каждого кода
+        """
+        offline = [self._barcode_offline(barcode) for barcode in barcodes]
+        results, misses = self._split_barcode_batch(barcodes, offline)
+        if not misses:
+            return results
+        
+        workers = min(max_concurrency or config.Config.OPENFOODFACTS_BATCH_CONCURRENCY, len(misses))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = executor.map(self._barcode_online, misses)
+            for barcode, lookup in zip(misses, fetched):
+                for position in misses[barcode]:
+                    results[position] = lookup
+        
+        return results
+    
+    @staticmethod
+    def _split_barcode_batch(barcodes: List[str], offline: List[Optional[BarcodeLookup]]):
+        """Разделить пакет на готовые результаты (offline) и промахи (штрих-код -> позиции)"""
+        results: List[Optional[BarcodeLookup]] = [None] * len(barcodes)
+        misses: Dict[str, List[int]] = {}
+        
+        for position, (barcode, lookup) in enumerate(zip(barcodes, offline)):
+            if lookup:
+                results[position] = lookup
+            else:
+                misses.setdefault(barcode, []).append(position)
+        
+        return results, misses
+    
+    def _barcode_offline(self, barcode: str) -> Optional[BarcodeLookup]:
+        """Поиск штрих-кода в кэше и локальной базе без сети"""
+        cache_key = f"barcode_{barcode}"
+        cached_data = self._cache_get(cache_key, self._barcode_refresh(barcode, cache_key))
+        if cached_data is not MISSING:
+            return BarcodeLookup(barcode, cached_data, 'cached' if cached_data else 'not_found')
+        
+        stored = self._barcode_from_store(barcode, cache_key)
+        if stored:
+            return BarcodeLookup(barcode, stored, 'local')
+        
+        return None
+    
+    def _barcode_refresh(self, barcode: str, cache_key: str) -> Callable:
+        """Фоновое обновление устаревшего продукта по штрих-коду"""
+        return lambda: self._flights.do(
+            cache_key, self._fetch_barcode, barcode, cache_key, PriorityRateLimiter.BACKGROUND
+        )
+    
+    def _barcode_online(self, barcode: str) -> BarcodeLookup:
+        """Запрос штрих-кода в Open Food Facts"""
+        cache_key = f"barcode_{barcode}"
         try:
-            cache_key = f"barcode_{barcode}"
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                if datetime.now() - timestamp < self.cache_expiry:
-                    return cached_data
-            
-            url = f"{self.base_url}/api/v2/product/{barcode}.json"
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code == 404:
-                logger.warning(f"Product with barcode {barcode} not found")
-                return None
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            if data.get('status') == 1:  # 1 means product found
-                product_info = self._parse_product_data(data['product'])
-                if product_info:
-                    self.cache[cache_key] = (product_info, datetime.now())
-                return product_info
-            
-            return None
-            
-        except requests.exceptions.RequestException as e:
+            product_info = self._flights.do(cache_key, self._fetch_barcode, barcode, cache_key)
+        except (requests.exceptions.RequestException, CircuitOpenError, RateLimitTimeout, ValueError) as e:
             logger.error(f"Error fetching product by barcode: {e}")
+            return BarcodeLookup(barcode, None, 'error', str(e))
+        
+        return BarcodeLookup(barcode, product_info, 'found' if product_info else 'not_found')
+    
+    def _fetch_search(self, query: str, cache_key: str, limit: int,
+                      priority: int = PriorityRateLimiter.INTERACTIVE) -> List[ProductInfo]:
+        """Запрос поиска в Open Food Facts (выполняется одним потоком на ключ)"""
+        # Результат мог появиться, пока мы ждали своей очереди
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not MISSING:
+            return cached_data
+        
+        url, params = self._search_request(query, limit)
+        
+        logger.info(f"Searching Open Food Facts for: {query}")
+        response = self._http_get(url, params, self.search_limiter, priority)
+        response.raise_for_status()
+        
+        return self._handle_search_data(query, cache_key, response.json())
+    
+    def _fetch_barcode(self, barcode: str, cache_key: str,
+                       priority: int = PriorityRateLimiter.INTERACTIVE) -> Optional[ProductInfo]:
+        """Запрос продукта по штрих-коду (выполняется одним потоком на ключ)"""
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not MISSING:
+            return cached_data
+        
+        url, params = self._barcode_request(barcode)
+        response = self._http_get(url, params, self.product_limiter, priority)
+        
+        if response.status_code == 404:
+            logger.warning(f"Product with barcode {barcode} not found")
+            self._cache_put(cache_key, None)
             return None
+        
+        response.raise_for_status()
+        
+        return self._handle_barcode_data(cache_key, response.json())
     
-    def _parse_product_data(self, product_data: Dict) -> Optional[ProductInfo]:
+    @staticmethod
+    def _parse_product_data(product_data: Dict) -> Optional[ProductInfo]:
         """
         Парсинг данных продукта из Open Food Facts
         
@@ -271,23 +824,12 @@ class OpenFoodFactsAPI:
             if calories == 0 and protein == 0 and fat == 0 and carbs == 0:
                 return None
             
-            # Получаем дополнительные данные
-            serving_size = nutriments.get('serving_size')
-            serving_size_g = 100  # по умолчанию 100г
-            
-            if serving_size:
-                # Парсим размер порции (например, "100g" или "50 ml")
-                match = re.search(r'(\d+(?:\.\d+)?)\s*g', serving_size.lower())
-                if match:
-                    serving_size_g = float(match.group(1))
-            
             # NOVA группа (степень обработки)
             nova_group = None
-            nova_tags = product_data.get('nova_groups_tags', [])
-            if nova_tags:
+            if product_data.get('nova_group'):
                 try:
-                    nova_group = int(nova_tags[0].split('-')[-1])
-                except (ValueError, IndexError):
+                    nova_group = int(float(product_data['nova_group']))
+                except (ValueError, TypeError):
                     pass
             
             return ProductInfo(
@@ -299,12 +841,12 @@ class OpenFoodFactsAPI:
                 fiber=round(fiber, 1) if fiber else None,
                 sugar=round(sugar, 1) if sugar else None,
                 salt=round(salt, 3) if salt else None,
-                serving_size_g=serving_size_g,
+                serving_size_g=100,  # значения *_100g - на 100 г, размер порции OFF на них не влияет
                 source='openfoodfacts',
                 success=True,
                 barcode=product_data.get('code'),
-                brands=product_data.get('brands'),
-                categories=product_data.get('categories'),
+                brands=intern_text(product_data.get('brands')),
+                categories=intern_text(product_data.get('categories')),
                 nova_group=nova_group
             )
             
@@ -316,57 +858,89 @@ class OpenFoodFactsAPI:
         """
         Основной метод для получения информации о продукте
         
-        Пытается найти продукт в Open Food Facts, если не находит,
-        ищет в локальной базе или оценивает по категории
+        Опрашивает источники цепочки self.resolver по порядку
+        (PRODUCT_RESOLVER_CHAIN) до первого найденного продукта; если
+        не ответил ни один, оценивает продукт по категории
         """
-        # Сначала ищем в Open Food Facts
+        product = self.resolver.resolve(query)
+        return product or self._estimate_product_info(query)
+    
+    def _resolver_sources(self) -> Dict[str, Callable[[str], Optional[ProductInfo]]]:
+        """Уровни, доступные для PRODUCT_RESOLVER_CHAIN"""
+        return {
+            'cache': self._resolve_cached,                # кэш поиска в памяти и на диске
+            'fuzzy': self._resolve_cached_fuzzy,          # похожий запрос, уже найденный в сети
+            'store': self._resolve_store,                 # локальная копия дампа Open Food Facts
+            'local': self._resolve_local,                 # локальная база, точное название
+            'openfoodfacts': self._resolve_online,        # поиск Open Food Facts
+            'local_approx': self._resolve_local_approx,   # локальная база, частичное совпадение
+            'estimate': self._estimate_product_info,      # оценка по категории
+        }
+    
+    def _build_resolver(self, chain: List[str], timeouts: Dict[str, float]) -> ResolverChain:
+        sources = self._resolver_sources()
+        tiers = []
+        for name in chain:
+            if name not in sources:
+                logger.warning(f"Unknown product resolver tier '{name}' skipped")
+                continue
+            tiers.append(ResolverTier(name, sources[name], timeouts.get(name)))
+        return ResolverChain(tiers, max_workers=config.Config.OPENFOODFACTS_BATCH_CONCURRENCY)
+    
+    def _resolve_cached(self, query: str) -> Optional[ProductInfo]:
+        query, cache_key = self._search_query(query)
+        cached_data = self._cache_get(cache_key, self._search_refresh(query, cache_key, 3))
+        return cached_data[0] if cached_data is not MISSING and cached_data else None
+    
+    def _resolve_cached_fuzzy(self, query: str) -> Optional[ProductInfo]:
+        return self._lookup_cached_fuzzy(normalize_query(query) or query)
+    
+    def _resolve_store(self, query: str) -> Optional[ProductInfo]:
+        query, cache_key = self._search_query(query)
+        stored = self._search_store(query, cache_key, 3)
+        return stored[0] if stored else None
+    
+    def _resolve_local(self, query: str) -> Optional[ProductInfo]:
+        product_name = self.local_index.find_exact(query)
+        return self._local_product(product_name, 'local_db') if product_name else None
+    
+    def _resolve_online(self, query: str) -> Optional[ProductInfo]:
         search_results = self.search_product(query, limit=3)
-        
-        if search_results:
-            # Возвращаем самый релевантный результат
-            return search_results[0]
-        
-        # Если не нашли в Open Food Facts, ищем в локальной базе
+        return search_results[0] if search_results else None
+    
+    def _resolve_local_approx(self, query: str) -> Optional[ProductInfo]:
+        return self._lookup_local_db(normalize_query(query) or query)
+    
+    def _lookup_cached_fuzzy(self, query: str) -> Optional[ProductInfo]:
+        """Нечеткий поиск среди запросов и продуктов, уже полученных из сети"""
+        match = self.cached_fuzzy.search(query, self.fuzzy_threshold)
+        # Продукт мог быть вытеснен из таблицы раньше, чем из индекса
+        return self.catalog.get(match[0]) if match else None
+    
+    def _lookup_local_db(self, query: str) -> Optional[ProductInfo]:
+        """Поиск продукта в локальной базе: точное, затем частичное совпадение"""
         query_lower = query.lower()
         
         # Пробуем найти точное совпадение
-        for product_name, nutrients in self.local_db.items():
-            if product_name in query_lower:
-                return ProductInfo(
-                    name=product_name.capitalize(),
-                    calories=nutrients['calories'],
-                    protein=nutrients['protein'],
-                    fat=nutrients['fat'],
-                    carbs=nutrients['carbs'],
-                    fiber=nutrients.get('fiber'),
-                    serving_size_g=100,
-                    source='local_db',
-                    success=True
-                )
+        product_name = self.local_index.find_in_query(query_lower)
+        if product_name:
+            return self._local_product(product_name, 'local_db')
         
         # Если не нашли точного совпадения, ищем по частичным совпадениям
-        for product_name, nutrients in self.local_db.items():
-            # Разбиваем запрос на слова
-            query_words = set(query_lower.split())
-            product_words = set(product_name.split())
-            
-            # Проверяем пересечение слов
-            common_words = query_words.intersection(product_words)
-            if len(common_words) >= 1:
-                return ProductInfo(
-                    name=product_name.capitalize(),
-                    calories=nutrients['calories'],
-                    protein=nutrients['protein'],
-                    fat=nutrients['fat'],
-                    carbs=nutrients['carbs'],
-                    fiber=nutrients.get('fiber'),
-                    serving_size_g=100,
-                    source='local_db_approx',
-                    success=True
-                )
+        product_name = self.local_index.find_by_words(query_lower)
+        if product_name:
+            return self._local_product(product_name, 'local_db_approx')
+        
+        # Затем по похожим названиям (опечатки, другие падежи)
+        match = self.local_fuzzy.search(query, self.fuzzy_threshold)
+        if match:
+            return match[0]
         
-        # Если ничего не нашли, оцениваем по категории
-        return self._estimate_product_info(query)
+        return None
+    
+    def _local_product(self, product_name: str, source: str) -> ProductInfo:
+        """ProductInfo для записи локальной базы"""
+        return replace(self.local_db.get(product_name), source=source)
     
     def _estimate_product_info(self, query: str) -> ProductInfo:
         """
@@ -387,27 +961,8 @@ class OpenFoodFactsAPI:
             'напиток': {'calories': 30, 'protein': 0.5, 'fat': 0, 'carbs': 7},
         }
         
-        # Ключевые слова для категорий
-        category_keywords = {
-            'фрукт': ['фрукт', 'ягод', 'абрикос', 'вишн', 'груш', 'персик', 'слив'],
-            'овощ': ['овощ', 'огур', 'помидор', 'картош', 'морков', 'капуст', 'лук'],
-            'мясо': ['мясо', 'говядин', 'свинин', 'баран', 'курин', 'индейк'],
-            'рыба': ['рыба', 'лосос', 'форел', 'тунец', 'селед', 'скумбр'],
-            'молочный': ['молок', 'кефир', 'йогурт', 'творог', 'сыр', 'сметан'],
-            'крупа': ['рис', 'гречк', 'овсян', 'перлов', 'пшен', 'макарон'],
-            'хлеб': ['хлеб', 'булк', 'батон', 'бухан', 'лаваш'],
-            'сладость': ['шоколад', 'конфет', 'печень', 'торт', 'пирож', 'морожен'],
-            'напиток': ['сок', 'компот', 'лимонад', 'кола', 'пепси', 'напиток'],
-        }
-        
         # Определяем категорию по ключевым словам
-        estimated_category = 'овощ'  # категория по умолчанию
-        
-        for category, keywords in category_keywords.items():
-            for keyword in keywords:
-                if keyword in query_lower:
-                    estimated_category = category
-                    break
+        estimated_category = self._category_of(query_lower) or 'овощ'  # категория по умолчанию
         
         # Берем средние значения для категории
         if estimated_category in categories:
@@ -426,78 +981,534 @@ class OpenFoodFactsAPI:
             success=True
         )
     
-    def analyze_meal(self, meal_description: str) -> Dict:
+    def _parse_meal_description(self, meal_description: str) -> List[tuple]:
         """
-        Анализ описания приема пищи с несколькими ингредиентами
+        Разбор описания приема пищи на пары (ингредиент, количество в граммах)
         
         Пример: "200г овсянки с молоком и бананом"
         """
-        try:
-            # Простой парсинг (можно улучшить)
-            ingredients = []
+        # Простой парсинг (можно улучшить)
+        items = []
+        
+        # Ищем паттерны типа "200г овсянки"
+        pattern = r'(\d+(?:\.\d+)?)\s*(г|грамм|кг|мл|литр|л)?\s+([а-яА-Я\s]+)'
+        matches = re.findall(pattern, meal_description, re.IGNORECASE)
+        
+        for amount_str, unit, ingredient in matches:
+            try:
+                amount = float(amount_str)
+            except ValueError:
+                continue
             
-            # Ищем паттерны типа "200г овсянки"
-            pattern = r'(\d+(?:\.\d+)?)\s*(?:г|грамм|кг|мл|литр|л)?\s+([а-яА-Я\s]+)'
-            matches = re.findall(pattern, meal_description, re.IGNORECASE)
+            # Конвертируем кг и литры в граммы
+            amount *= unit_grams(unit)
             
-            for amount_str, ingredient in matches:
-                try:
-                    amount = float(amount_str)
-                    
-                    # Конвертируем кг в граммы
-                    if 'кг' in meal_description.lower():
-                        amount *= 1000
-                    
-                    # Ищем продукт
-                    product_info = self.get_product_info(ingredient.strip())
-                    
-                    if product_info.success:
-                        # Масштабируем питательные вещества
-                        scale = amount / product_info.serving_size_g
-                        
-                        ingredients.append({
-                            'name': product_info.name,
-                            'amount_g': amount,
-                            'calories': product_info.calories * scale,
-                            'protein': product_info.protein * scale,
-                            'fat': product_info.fat * scale,
-                            'carbs': product_info.carbs * scale
-                        })
-                        
-                except (ValueError, KeyError):
-                    continue
+            items.append((ingredient.strip(), amount))
+        
+        # Если не нашли паттерны, пробуем просто найти продукты
+        if not items:
+            for word in meal_description.split():
+                if len(word) > 3:  # Игнорируем короткие слова
+                    # Используем стандартную порцию
+                    items.append((word, 100))
+        
+        return items
+    
+    @staticmethod
+    def _scale_ingredient(product_info: ProductInfo, amount: float) -> Dict:
+        """Питательные вещества продукта в пересчете на указанное количество"""
+        scale = amount / product_info.serving_size_g
+        
+        return {
+            'name': product_info.name,
+            'amount_g': amount,
+            'calories': product_info.calories * scale,
+            'protein': product_info.protein * scale,
+            'fat': product_info.fat * scale,
+            'carbs': product_info.carbs * scale
+        }
+    
+    @staticmethod
+    def _meal_result(meal_description: str, ingredients: List[Dict],
+                     unresolved: Optional[List[str]] = None) -> Dict:
+        """Итог анализа приема пищи: суммы по всем ингредиентам"""
+        total = {
+            'calories': sum(i['calories'] for i in ingredients),
+            'protein': sum(i['protein'] for i in ingredients),
+            'fat': sum(i['fat'] for i in ingredients),
+            'carbs': sum(i['carbs'] for i in ingredients),
+            'ingredients': ingredients
+        }
+        
+        return {
+            'success': len(ingredients) > 0,
+            'total': total,
+            'meal_description': meal_description,
+            # Ингредиенты, которые не успели найти до истечения срока
+            'unresolved': unresolved or []
+        }
+    
+    @staticmethod
+    def _ingredient_key(ingredient: str) -> str:
+        """Ключ для объединения повторяющихся ингредиентов"""
+        return query_key(ingredient)
+    
+    def _unique_ingredients(self, items: List[tuple]) -> Dict[str, str]:
+        """Уникальные ингредиенты описания: ключ -> название для поиска"""
+        unique = {}
+        for ingredient, _ in items:
+            unique.setdefault(self._ingredient_key(ingredient), ingredient)
+        return unique
+    
+    def _assemble_meal(self, meal_description: str, items: List[tuple],
+                       resolved: Dict[str, ProductInfo]) -> Dict:
+        """Собрать результат из найденных продуктов, сохраняя порядок описания"""
+        ingredients = []
+        unresolved = []
+        
+        for ingredient, amount in items:
+            product_info = resolved.get(self._ingredient_key(ingredient))
+            if product_info is None:
+                unresolved.append(ingredient)
+            elif product_info.success:
+                # Масштабируем питательные вещества
+                ingredients.append(self._scale_ingredient(product_info, amount))
+        
+        return self._meal_result(meal_description, ingredients, unresolved)
+    
+    def analyze_meal(self, meal_description: str, deadline: Optional[float] = None) -> Dict:
+        """
+        Анализ описания приема пищи с несколькими ингредиентами
+        
+        Пример: "200г овсянки с молоком и бананом"
+        
+        Уникальные ингредиенты ищутся параллельно; по истечении deadline
+        секунд возвращается то, что успели найти.
+        """
+        try:
+            items = self._parse_meal_description(meal_description)
+            if deadline is None:
+                deadline = config.Config.MEAL_ANALYSIS_DEADLINE
+            resolved = self._resolve_ingredients(self._unique_ingredients(items), deadline)
             
-            # Если не нашли паттерны, пробуем просто найти продукты
-            if not ingredients:
-                words = meal_description.split()
-                for word in words:
-                    if len(word) > 3:  # Игнорируем короткие слова
-                        product_info = self.get_product_info(word)
-                        if product_info.success:
-                            # Используем стандартную порцию
-                            ingredients.append({
-                                'name': product_info.name,
-                                'amount_g': 100,
-                                'calories': product_info.calories,
-                                'protein': product_info.protein,
-                                'fat': product_info.fat,
-                                'carbs': product_info.carbs
-                            })
-            
-            # Суммируем все ингредиенты
-            total = {
-                'calories': sum(i['calories'] for i in ingredients),
-                'protein': sum(i['protein'] for i in ingredients),
-                'fat': sum(i['fat'] for i in ingredients),
-                'carbs': sum(i['carbs'] for i in ingredients),
-                'ingredients': ingredients
-            }
+            return self._assemble_meal(meal_description, items, resolved)
             
+        except Exception as e:
+            logger.error(f"Error analyzing meal: {e}")
             return {
-                'success': len(ingredients) > 0,
-                'total': total,
+                'success': False,
+                'error': str(e),
                 'meal_description': meal_description
             }
+    
+    def analyze_meals(self, meal_descriptions: List[str], deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Пакетный анализ многих описаний (импорт дневника, пересчет истории)
+        
+        Все описания разбираются сразу, каждый уникальный ингредиент ищется
+        один раз на весь пакет, а пересчет на количество и суммы по приемам
+        пищи считаются матричными операциями. Результаты - в формате
+        analyze_meal, в порядке описаний. Без deadline ждем все ингредиенты.
+        """
+        try:
+            parsed = [self._parse_meal_description(description) for description in meal_descriptions]
+            unique = self._unique_ingredients([item for items in parsed for item in items])
+            resolved = self._resolve_ingredients(unique, deadline)
+            
+            return self._assemble_meals(meal_descriptions, parsed, resolved)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing meals: {e}")
+            return [
+                {'success': False, 'error': str(e), 'meal_description': description}
+                for description in meal_descriptions
+            ]
+    
+    def _resolve_ingredients(self, unique: Dict[str, str], deadline: Optional[float]) -> Dict[str, ProductInfo]:
+        """Параллельный поиск уникальных ингредиентов: ключ -> продукт (что успели за deadline)"""
+        resolved = {}
+        if not unique:
+            return resolved
+        
+        executor = ThreadPoolExecutor(
+            max_workers=min(len(unique), config.Config.OPENFOODFACTS_BATCH_CONCURRENCY)
+        )
+        futures = {
+            executor.submit(self.get_product_info, ingredient): key
+            for key, ingredient in unique.items()
+        }
+        done, _ = wait(futures, timeout=deadline)
+        # Не ждем отставших: их результаты все равно попадут в кэш
+        executor.shutdown(wait=False)
+        
+        for future in done:
+            if future.exception() is None:
+                resolved[futures[future]] = future.result()
+            else:
+                logger.error(f"Error resolving ingredient: {future.exception()}")
+        
+        return resolved
+    
+    def _assemble_meals(self, meal_descriptions: List[str], parsed: List[List[tuple]],
+                        resolved: Dict[str, ProductInfo]) -> List[Dict]:
+        """
+        Итоги по пакету описаний
+        
+        Питательные вещества на грамм (продукты x MEAL_NUTRIENTS) умножаются
+        на количества всех ингредиентов сразу, суммы по приемам пищи
+        собираются через np.add.at.
+        """
+        keys = [key for key, product_info in resolved.items() if product_info.success]
+        rows = {key: row for row, key in enumerate(keys)}
+        per_gram = np.array(
+            [[getattr(resolved[key], nutrient) for nutrient in MEAL_NUTRIENTS] for key in keys],
+            dtype=np.float64
+        ).reshape(len(keys), len(MEAL_NUTRIENTS))
+        per_gram /= np.array([resolved[key].serving_size_g for key in keys], dtype=np.float64)[:, None]
+        
+        meal_ids, product_rows, amounts = [], [], []
+        unresolved = [[] for _ in meal_descriptions]
+        for meal_id, items in enumerate(parsed):
+            for ingredient, amount in items:
+                key = self._ingredient_key(ingredient)
+                if key in rows:
+                    meal_ids.append(meal_id)
+                    product_rows.append(rows[key])
+                    amounts.append(amount)
+                elif key not in resolved:
+                    unresolved[meal_id].append(ingredient)
+        
+        scaled = per_gram[np.array(product_rows, dtype=np.intp)] * np.array(amounts, dtype=np.float64)[:, None]
+        totals = np.zeros((len(meal_descriptions), len(MEAL_NUTRIENTS)))
+        np.add.at(totals, np.array(meal_ids, dtype=np.intp), scaled)
+        
+        ingredients = [[] for _ in meal_descriptions]
+        for meal_id, row, amount, values in zip(meal_ids, product_rows, amounts, scaled.tolist()):
+            ingredients[meal_id].append({
+                'name': resolved[keys[row]].name,
+                'amount_g': amount,
+                **dict(zip(MEAL_NUTRIENTS, values))
+            })
+        
+        return [
+            {
+                'success': len(ingredients[meal_id]) > 0,
+                'total': {**dict(zip(MEAL_NUTRIENTS, totals[meal_id].tolist())), 'ingredients': ingredients[meal_id]},
+                'meal_description': description,
+                'unresolved': unresolved[meal_id]
+            }
+            for meal_id, description in enumerate(meal_descriptions)
+        ]
+
+
+class AsyncOpenFoodFactsAPI(OpenFoodFactsAPI):
+    """
+    Асинхронный клиент Open Food Facts
+    
+    Та же поверхность, что у OpenFoodFactsAPI, но методы - корутины,
+    а запросы идут через общий пул keep-alive соединений httpx.
+    Обработчики ожидают их напрямую, без asyncio.to_thread.
+    """
+    
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20):
+        super().__init__()
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._flights = AsyncSingleFlight()
+        self.hedge_requests = config.Config.OPENFOODFACTS_HEDGE_REQUESTS
+        self.hedged = 0
+        self._refresh_semaphore = asyncio.Semaphore(config.Config.OPENFOODFACTS_REVALIDATE_CONCURRENCY)
+        self._refresh_tasks = set()
+        # Запись в SQLite-кэш - в фоне, по одной, чтобы не блокировать event loop
+        self._disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='off-cache-writer')
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Ленивое создание клиента внутри работающего event loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=DEFAULT_HEADERS,
+                limits=self.limits,
+                timeout=config.Config.OPENFOODFACTS_REQUEST_TIMEOUT
+            )
+        return self._client
+    
+    def _schedule_refresh(self, cache_key: str, refresh: Callable):
+        """Фоновое обновление устаревшей записи задачей event loop"""
+        if cache_key in self._refreshing:
+            return
+        self._refreshing.add(cache_key)
+        self.revalidations += 1
+        
+        task = asyncio.ensure_future(self._revalidate(cache_key, refresh))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+    
+    async def _revalidate(self, cache_key: str, refresh: Callable):
+        try:
+            async with self._refresh_semaphore:
+                await refresh()
+        except Exception as e:
+            logger.warning(f"Background refresh of {cache_key} failed: {e}")
+        finally:
+            self._refreshing.discard(cache_key)
+    
+    async def _cache_get(self, cache_key: str, refresh: Optional[Callable] = None):
+        """Асинхронный вариант OpenFoodFactsAPI._cache_get: SQLite читается в отдельном потоке"""
+        cached_data, stale = self.cache.get_with_state(cache_key)
+        if cached_data is MISSING:
+            cached_data, stale = await asyncio.to_thread(self._persistent_get, cache_key)
+            if cached_data is MISSING:
+                return MISSING
+        
+        if stale and refresh is not None:
+            self._schedule_refresh(cache_key, refresh)
+        return cached_data
+    
+    def _cache_put(self, cache_key: str, value):
+        """Сохранить результат в памяти сразу, на диске - в фоновом потоке"""
+        self.cache.put(cache_key, value)
+        self._disk_writer.submit(self._persistent_put, cache_key, value)
+    
+    async def aclose(self):
+        """Закрыть пул соединений"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _http_get(self, url: str, params: Optional[Dict] = None,
+                        limiter: Optional[PriorityRateLimiter] = None,
+                        priority: int = PriorityRateLimiter.INTERACTIVE) -> httpx.Response:
+        """GET к Open Food Facts с ограничением частоты, адаптивным таймаутом, автоматом защиты и хеджированием"""
+        self._check_circuit()
+        try:
+            if limiter is not None:
+                await limiter.acquire_async(priority, self._rate_limit_wait(priority))
+            started = time.monotonic()
+            response = await self._hedged_get(url, params, self._request_timeout(), limiter)
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Ожидание очереди или запрос отменены: освобождаем пробный вызов
+            self.breaker.release_probe()
+            raise
+        
+        self._record_response(response, time.monotonic() - started, limiter)
+        return response
+    
+    async def _hedged_get(self, url: str, params: Optional[Dict], timeout: float,
+                          limiter: Optional[PriorityRateLimiter] = None) -> httpx.Response:
+        """
+        Запрос с хеджированием хвостовых задержек
+        
+        Если ответ не пришел за типичное (p95) время, отправляется второй
+        такой же запрос, и используется первый успешный из двух. Второй
+        запрос отправляется, только если ограничитель частоты сразу
+        выдает на него токен.
+        """
+        client = self._get_client()
+        hedge_delay = self.latency.percentile(0.95) if self.hedge_requests else None
+        
+        first = asyncio.ensure_future(client.get(url, params=params, timeout=timeout))
+        if hedge_delay is None:
+            return await first
+        
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and (limiter is None or limiter.try_acquire()):
+                self.hedged += 1
+                tasks.add(asyncio.ensure_future(client.get(url, params=params, timeout=timeout)))
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def search_product(self, query: str, limit: int = 5) -> List[ProductInfo]:
+        """Асинхронный поиск продукта по названию в Open Food Facts"""
+        try:
+            query, cache_key = self._search_query(query)
+            cached_data = await self._cache_get(cache_key, self._search_refresh(query, cache_key, limit))
+            if cached_data is not MISSING:
+                return cached_data
+            
+            stored = await asyncio.to_thread(self._search_store, query, cache_key, limit)
+            if stored:
+                return stored
+            
+            return await self._flights.do(cache_key, self._fetch_search, query, cache_key, limit)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Error searching Open Food Facts: {e}")
+            return []
+        except (CircuitOpenError, RateLimitTimeout) as e:
+            logger.warning(f"Skipping search for '{query}': {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return []
+    
+    async def ping(self) -> Optional[str]:
+        """Проверка доступности Open Food Facts запросом мимо кэшей и локальных баз"""
+        url, params = self._barcode_request(PING_BARCODE)
+        response = await self._http_get(url, params, self.product_limiter)
+        response.raise_for_status()
+        return response.json().get('product', {}).get('product_name')
+    
+    async def warm_up(self, queries: List[str], limit: int = 3) -> Dict[str, float]:
+        """Асинхронный вариант OpenFoodFactsAPI.warm_up"""
+        stats = {'queries': 0, 'cached': 0, 'fetched': 0, 'empty': 0, 'failed': 0}
+        
+        for query in self._warm_up_queries(queries):
+            stats['queries'] += 1
+            query, cache_key = self._search_query(query)
+            try:
+                if (await self._cache_get(cache_key) is not MISSING
+                        or await asyncio.to_thread(self._search_store, query, cache_key, limit)):
+                    stats['cached'] += 1
+                    continue
+                
+                products = await self._flights.do(
+                    cache_key, self._fetch_search, query, cache_key, limit, PriorityRateLimiter.BACKGROUND
+                )
+            except CircuitOpenError as e:
+                logger.warning(f"Cache warm-up stopped: {e}")
+                stats['failed'] += 1
+                break
+            except Exception as e:
+                logger.warning(f"Cache warm-up failed for '{query}': {e}")
+                stats['failed'] += 1
+                continue
+            
+            stats['fetched' if products else 'empty'] += 1
+        
+        return self._warm_up_result(stats)
+    
+    async def get_product_by_barcode(self, barcode: str) -> Optional[ProductInfo]:
+        """Асинхронное получение продукта по штрих-коду"""
+        lookup = await self._barcode_offline(barcode) or await self._barcode_online(barcode)
+        return lookup.product
+    
+    async def get_products_by_barcodes(self, barcodes: List[str],
+                                       max_concurrency: Optional[int] = None) -> List[BarcodeLookup]:
+        """Асинхронный вариант OpenFoodFactsAPI.get_products_by_barcodes"""
+        offline = [await self._barcode_offline(barcode) for barcode in barcodes]
+        results, misses = self._split_barcode_batch(barcodes, offline)
+        if not misses:
+            return results
+        
+        semaphore = asyncio.Semaphore(max_concurrency or config.Config.OPENFOODFACTS_BATCH_CONCURRENCY)
+        
+        async def fetch(barcode: str) -> BarcodeLookup:
+            async with semaphore:
+                return await self._barcode_online(barcode)
+        
+        fetched = await asyncio.gather(*(fetch(barcode) for barcode in misses))
+        for barcode, lookup in zip(misses, fetched):
+            for position in misses[barcode]:
+                results[position] = lookup
+        
+        return results
+    
+    async def _barcode_offline(self, barcode: str) -> Optional[BarcodeLookup]:
+        """Асинхронный вариант OpenFoodFactsAPI._barcode_offline"""
+        cache_key = f"barcode_{barcode}"
+        cached_data = await self._cache_get(cache_key, self._barcode_refresh(barcode, cache_key))
+        if cached_data is not MISSING:
+            return BarcodeLookup(barcode, cached_data, 'cached' if cached_data else 'not_found')
+        
+        stored = await asyncio.to_thread(self._barcode_from_store, barcode, cache_key)
+        if stored:
+            return BarcodeLookup(barcode, stored, 'local')
+        
+        return None
+    
+    async def _barcode_online(self, barcode: str) -> BarcodeLookup:
+        """Запрос штрих-кода в Open Food Facts"""
+        cache_key = f"barcode_{barcode}"
+        try:
+            product_info = await self._flights.do(cache_key, self._fetch_barcode, barcode, cache_key)
+        except (httpx.HTTPError, CircuitOpenError, RateLimitTimeout, ValueError) as e:
+            # ValueError - тело ответа не JSON (например, страница ошибки прокси)
+            logger.error(f"Error fetching product by barcode: {e}")
+            return BarcodeLookup(barcode, None, 'error', str(e))
+        
+        return BarcodeLookup(barcode, product_info, 'found' if product_info else 'not_found')
+    
+    async def _fetch_search(self, query: str, cache_key: str, limit: int,
+                            priority: int = PriorityRateLimiter.INTERACTIVE) -> List[ProductInfo]:
+        """Запрос поиска в Open Food Facts (одна задача на ключ)"""
+        # Результат мог появиться, пока корутина ждала чтения диска
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not MISSING:
+            return cached_data
+        
+        url, params = self._search_request(query, limit)
+        
+        logger.info(f"Searching Open Food Facts for: {query}")
+        response = await self._http_get(url, params, self.search_limiter, priority)
+        response.raise_for_status()
+        
+        return self._handle_search_data(query, cache_key, response.json())
+    
+    async def _fetch_barcode(self, barcode: str, cache_key: str,
+                             priority: int = PriorityRateLimiter.INTERACTIVE) -> Optional[ProductInfo]:
+        """Запрос продукта по штрих-коду (одна задача на ключ)"""
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not MISSING:
+            return cached_data
+        
+        url, params = self._barcode_request(barcode)
+        response = await self._http_get(url, params, self.product_limiter, priority)
+        
+        if response.status_code == 404:
+            logger.warning(f"Product with barcode {barcode} not found")
+            self._cache_put(cache_key, None)
+            return None
+        
+        response.raise_for_status()
+        
+        return self._handle_barcode_data(cache_key, response.json())
+    
+    async def get_product_info(self, query: str) -> ProductInfo:
+        """Асинхронный вариант OpenFoodFactsAPI.get_product_info"""
+        product = await self.resolver.resolve_async(query)
+        return product or self._estimate_product_info(query)
+    
+    async def _resolve_cached(self, query: str) -> Optional[ProductInfo]:
+        query, cache_key = self._search_query(query)
+        cached_data = await self._cache_get(cache_key, self._search_refresh(query, cache_key, 3))
+        return cached_data[0] if cached_data is not MISSING and cached_data else None
+    
+    async def _resolve_store(self, query: str) -> Optional[ProductInfo]:
+        query, cache_key = self._search_query(query)
+        stored = await asyncio.to_thread(self._search_store, query, cache_key, 3)
+        return stored[0] if stored else None
+    
+    async def _resolve_online(self, query: str) -> Optional[ProductInfo]:
+        search_results = await self.search_product(query, limit=3)
+        return search_results[0] if search_results else None
+    
+    async def analyze_meal(self, meal_description: str, deadline: Optional[float] = None) -> Dict:
+        """Асинхронный вариант OpenFoodFactsAPI.analyze_meal"""
+        try:
+            items = self._parse_meal_description(meal_description)
+            if deadline is None:
+                deadline = config.Config.MEAL_ANALYSIS_DEADLINE
+            resolved = await self._resolve_ingredients(self._unique_ingredients(items), deadline)
+            
+            return self._assemble_meal(meal_description, items, resolved)
             
         except Exception as e:
             logger.error(f"Error analyzing meal: {e}")
@@ -505,4 +1516,49 @@ class OpenFoodFactsAPI:
                 'success': False,
                 'error': str(e),
                 'meal_description': meal_description
-            }
\ No newline at end of file
+            }
+    
+    async def analyze_meals(self, meal_descriptions: List[str], deadline: Optional[float] = None) -> List[Dict]:
+        """Асинхронный вариант OpenFoodFactsAPI.analyze_meals"""
+        try:
+            parsed = [self._parse_meal_description(description) for description in meal_descriptions]
+            unique = self._unique_ingredients([item for items in parsed for item in items])
+            resolved = await self._resolve_ingredients(unique, deadline)
+            
+            return self._assemble_meals(meal_descriptions, parsed, resolved)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing meals: {e}")
+            return [
+                {'success': False, 'error': str(e), 'meal_description': description}
+                for description in meal_descriptions
+            ]
+    
+    async def _resolve_ingredients(self, unique: Dict[str, str],
+                                   deadline: Optional[float]) -> Dict[str, ProductInfo]:
+        """Конкурентный поиск уникальных ингредиентов; незавершенные к deadline отменяются"""
+        resolved = {}
+        if not unique:
+            return resolved
+        
+        semaphore = asyncio.Semaphore(config.Config.OPENFOODFACTS_BATCH_CONCURRENCY)
+        
+        async def resolve(ingredient: str) -> ProductInfo:
+            async with semaphore:
+                return await self.get_product_info(ingredient)
+        
+        tasks = {
+            asyncio.ensure_future(resolve(ingredient)): key
+            for key, ingredient in unique.items()
+        }
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        
+        for task in done:
+            if task.exception() is None:
+                resolved[tasks[task]] = task.result()
+            else:
+                logger.error(f"Error resolving ingredient: {task.exception()}")
+        
+        return resolved
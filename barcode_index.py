@@ -0,0 +1,162 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from models import ProductInfo
+
+logger = logging.getLogger(__name__)
+
+# Запись индекса: штрих-код, смещение и длина записи в файле данных
+INDEX_RECORD = struct.Struct('<QQI')
+_BARCODE = struct.Struct('<Q')
+
+# Ключ кода до 18 цифр (с ведущей единицей) помещается в знаковый 64-битный INTEGER SQLite
+MAX_BARCODE_DIGITS = 18
+
+
+def barcode_to_int(barcode: str) -> Optional[int]:
+    """
+    Числовой ключ штрих-кода или None, если код не числовой
+
+    К коду приписывается ведущая 1, чтобы сохранить ведущие нули:
+    "0012345" и "12345" (или EAN-13 и UPC-A формы) - разные ключи.
+    """
+    barcode = barcode.strip()
+    if not barcode.isdigit() or len(barcode) > MAX_BARCODE_DIGITS:
+        return None
+    return int('1' + barcode)
+
+
+class BarcodeIndex:
+    """
+    Индекс штрих-код -> продукт в отображаемых в память файлах
+
+    <path>.idx - отсортированные записи фиксированной ширины
+    (штрих-код, смещение, длина), поиск двоичный;
+    <path>.dat - JSON-записи продуктов подряд.
+
+    Файлы открываются через mmap только на чтение: резидентная память
+    почти не расходуется, а несколько процессов бота делят один
+    страничный кэш ОС.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self._files = []
+        self._index = self._map(f"{base_path}.idx")
+        self._data = self._map(f"{base_path}.dat")
+        self.count = len(self._index) // INDEX_RECORD.size if self._index else 0
+        self._check_consistency()
+
+    def _check_consistency(self):
+        """Файлы .idx и .dat из одной сборки: последняя запись кончается в конце данных"""
+        data_size = len(self._data) if self._data else 0
+        end = 0
+        if self.count:
+            _, offset, length = INDEX_RECORD.unpack_from(self._index, (self.count - 1) * INDEX_RECORD.size)
+            end = offset + length
+        if end != data_size:
+            self.close()
+            raise ValueError(f"index and data files do not match ({end} != {data_size} bytes)")
+
+    def _map(self, path: str) -> Optional[mmap.mmap]:
+        f = open(path, 'rb')
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open_if_exists(cls, base_path: Optional[str]) -> Optional['BarcodeIndex']:
+        """Открыть индекс, если оба файла существуют"""
+        if not base_path or not Path(f"{base_path}.idx").exists() or not Path(f"{base_path}.dat").exists():
+            return None
+
+        try:
+            index = cls(base_path)
+            logger.info(f"Barcode index opened: {base_path} ({index.count} products)")
+            return index
+        except (OSError, ValueError) as e:
+            logger.warning(f"Barcode index unavailable: {e}")
+            return None
+
+    @staticmethod
+    def build(base_path: str, records: Iterable[Tuple[int, bytes]]) -> int:
+        """
+        Записать индекс из пар (ключ barcode_to_int, запись),
+        уже отсортированных по ключу. Повторные коды пропускаются.
+
+        Оба файла пишутся во временные и подменяются по очереди; индекс,
+        открытый между подменами, отвергается проверкой согласованности.
+        """
+        index_tmp = f"{base_path}.idx.tmp"
+        data_tmp = f"{base_path}.dat.tmp"
+        count = 0
+        previous = None
+
+        with open(index_tmp, 'wb') as index_file, open(data_tmp, 'wb') as data_file:
+            offset = 0
+            for barcode, record in records:
+                if barcode == previous:
+                    continue
+                if previous is not None and barcode < previous:
+                    raise ValueError("records must be sorted by barcode")
+
+                data_file.write(record)
+                index_file.write(INDEX_RECORD.pack(barcode, offset, len(record)))
+                offset += len(record)
+                previous = barcode
+                count += 1
+
+        os.replace(data_tmp, f"{base_path}.dat")
+        os.replace(index_tmp, f"{base_path}.idx")
+        return count
+
+    def _find(self, key: int) -> Optional[Tuple[int, int]]:
+        """Двоичный поиск: смещение и длина записи"""
+        low, high = 0, self.count - 1
+
+        while low <= high:
+            middle = (low + high) // 2
+            position = middle * INDEX_RECORD.size
+            barcode, = _BARCODE.unpack_from(self._index, position)
+
+            if barcode < key:
+                low = middle + 1
+            elif barcode > key:
+                high = middle - 1
+            else:
+                _, offset, length = INDEX_RECORD.unpack_from(self._index, position)
+                return offset, length
+
+        return None
+
+    def get(self, barcode: str) -> Optional[ProductInfo]:
+        """Продукт по штрих-коду или None"""
+        key = barcode_to_int(barcode)
+        if key is None or not self.count:
+            return None
+
+        found = self._find(key)
+        if found is None:
+            return None
+
+        offset, length = found
+        try:
+            product = ProductInfo.from_dict(json.loads(self._data[offset:offset + length]))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Corrupted barcode index record for {barcode}: {e}")
+            return None
+        # Запись должна быть именно для запрошенного кода
+        return product if product.barcode == barcode.strip() else None
+
+    def close(self):
+        for mapped in (self._index, self._data):
+            if mapped is not None:
+                mapped.close()
+        for f in self._files:
+            f.close()
@@ -7,6 +7,8 @@ import asyncio
 import logging
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 
 from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler
@@ -15,6 +17,7 @@ from config import Config
 from handlers import BotHandlers, AGE, GENDER, WEIGHT, HEIGHT, ACTIVITY, GOAL, CLIMATE
 from ydb_client import ydb_client
 from api_client import OpenFoodFactsAPI
+from database import DatabaseManager
 
 # Настройка логирования для Sourcecraft
 logging.basicConfig(
@@ -88,15 +91,48 @@ async def initialize_services():
     
     # Инициализируем базу данных
     await initialize_database()
-    
-    # Тестируем API
+
+def check_openfoodfacts(api: OpenFoodFactsAPI):
+    """Проверка Open Food Facts прямым запросом (кэш и локальная база не участвуют)"""
     try:
-        api = OpenFoodFactsAPI()
-        test = api.get_product_info("яблоко")
-        logger.info(f"✅ Open Food Facts API работает, тестовый запрос: {test.name if test else 'ошибка'}")
+        name = api.ping()
+        logger.info(f"✅ Open Food Facts API работает, тестовый запрос: {name or 'без названия'}")
     except Exception as e:
         logger.warning(f"⚠️ Open Food Facts API недоступен: {e}")
 
+async def start_cache_warm_up(api: OpenFoodFactsAPI):
+    """
+    Прогрев кэша продуктов самыми частыми записями дневников
+    
+    Запросы выполняются синхронным клиентом api в фоновом потоке с
+    фоновым приоритетом. api использует кэш в памяти, ограничители
+    частоты и автомат защиты клиента обработчиков (share_state):
+    прогретые записи сразу видны боту, а запросы пользователей идут
+    вперед прогрева.
+    """
+    if not Config.WARMUP_TOP_N:
+        return
+    
+    rows = await DatabaseManager.get_popular_foods(Config.WARMUP_TOP_N)
+    foods = [row['food_name'] for row in rows if row.get('food_name')]
+    if not foods:
+        logger.info("ℹ️ Нет истории питания для прогрева кэша")
+        return
+    
+    def warm_up():
+        while True:
+            try:
+                stats = api.warm_up(foods)
+                logger.info(f"🔥 Кэш продуктов прогрет: {stats['hit_ratio']:.0%} популярных запросов без сети")
+            except Exception as e:
+                logger.error(f"❌ Ошибка прогрева кэша: {e}")
+            if not Config.WARMUP_INTERVAL_HOURS:
+                return
+            time.sleep(Config.WARMUP_INTERVAL_HOURS * 3600)
+    
+    threading.Thread(target=warm_up, name='cache-warm-up', daemon=True).start()
+    logger.info(f"🔄 Прогрев кэша: {len(foods)} популярных продуктов")
+
 def setup_handlers(dispatcher):
     """Настройка обработчиков команд"""
     bot_handlers = BotHandlers()
@@ -126,6 +162,7 @@ def setup_handlers(dispatcher):
         ('water', bot_handlers.water_intake),
         ('bmi', bot_handlers.bmi_calculator),
         ('product_info', bot_handlers.product_info),
+        ('alternatives', bot_handlers.alternatives),
         ('progress', bot_handlers.progress_tracking),
         ('recommend', bot_handlers.get_recommendations),
         ('history', bot_handlers.food_history),
@@ -143,6 +180,7 @@ def setup_handlers(dispatcher):
     dispatcher.add_error_handler(error_handler)
     
     logger.info(f"✅ Зарегистрировано {len(commands) + 1} команд")
+    return bot_handlers
 
 def error_handler(update, context):
     """Глобальный обработчик ошибок"""
@@ -196,7 +234,13 @@ def main():
         )
         
         # Настройка обработчиков
-        setup_handlers(updater.dispatcher)
+        bot_handlers = setup_handlers(updater.dispatcher)
+        
+        # Синхронный клиент для проверки сервиса и прогрева кэша обработчиков
+        off_api = OpenFoodFactsAPI()
+        off_api.share_state(bot_handlers.api)
+        check_openfoodfacts(off_api)
+        loop.run_until_complete(start_cache_warm_up(off_api))
         
         # Запуск бота
         logger.info("🤖 Запуск SlimTracker Bot...")
@@ -224,6 +268,7 @@ def main():
     finally:
         # Корректное завершение
         logger.info("🔄 Завершение работы...")
+        loop.run_until_complete(DatabaseManager.flush_writes())
         loop.run_until_complete(ydb_client.close())
 
 if __name__ == '__main__':
@@ -18,10 +18,68 @@ class Config:
     
     # Open Food Facts
     OPENFOODFACTS_REQUEST_TIMEOUT = int(os.getenv('OPENFOODFACTS_REQUEST_TIMEOUT', '10'))
+    # Нижняя граница адаптивного таймаута (секунды)
+    OPENFOODFACTS_MIN_TIMEOUT = float(os.getenv('OPENFOODFACTS_MIN_TIMEOUT', '1.5'))
+    # Автомат защиты: ошибок подряд до размыкания и пауза до пробного запроса
+    OPENFOODFACTS_CIRCUIT_FAILURES = int(os.getenv('OPENFOODFACTS_CIRCUIT_FAILURES', '5'))
+    OPENFOODFACTS_CIRCUIT_RESET_SECONDS = float(os.getenv('OPENFOODFACTS_CIRCUIT_RESET_SECONDS', '30'))
+    # Второй (хеджирующий) запрос, если первый дольше обычного p95
+    OPENFOODFACTS_HEDGE_REQUESTS = os.getenv('OPENFOODFACTS_HEDGE_REQUESTS', 'False').lower() == 'true'
+    # Ограничения частоты запросов Open Food Facts (поиск и чтение продуктов)
+    OPENFOODFACTS_SEARCH_RATE_PER_MINUTE = float(os.getenv('OPENFOODFACTS_SEARCH_RATE_PER_MINUTE', '10'))
+    OPENFOODFACTS_PRODUCT_RATE_PER_MINUTE = float(os.getenv('OPENFOODFACTS_PRODUCT_RATE_PER_MINUTE', '100'))
+    OPENFOODFACTS_RATE_BURST = int(os.getenv('OPENFOODFACTS_RATE_BURST', '5'))
+    # Сколько секунд запрос пользователя может ждать своей очереди
+    OPENFOODFACTS_RATE_LIMIT_MAX_WAIT = float(os.getenv('OPENFOODFACTS_RATE_LIMIT_MAX_WAIT', '10'))
+    # Пауза после ответа 429: по Retry-After, но не дольше этого (секунды)
+    OPENFOODFACTS_RETRY_AFTER_MAX = float(os.getenv('OPENFOODFACTS_RETRY_AFTER_MAX', '60'))
     OPENFOODFACTS_CACHE_HOURS = int(os.getenv('OPENFOODFACTS_CACHE_HOURS', '1'))
+    OPENFOODFACTS_BARCODE_CACHE_HOURS = int(os.getenv('OPENFOODFACTS_BARCODE_CACHE_HOURS', '24'))
+    OPENFOODFACTS_NEGATIVE_CACHE_MINUTES = int(os.getenv('OPENFOODFACTS_NEGATIVE_CACHE_MINUTES', '10'))
+    OPENFOODFACTS_CACHE_MAX_ENTRIES = int(os.getenv('OPENFOODFACTS_CACHE_MAX_ENTRIES', '5000'))
+    # Сколько часов после истечения срока запись еще отдается, обновляясь в фоне
+    OPENFOODFACTS_CACHE_MAX_STALE_HOURS = int(os.getenv('OPENFOODFACTS_CACHE_MAX_STALE_HOURS', '24'))
+    OPENFOODFACTS_REVALIDATE_CONCURRENCY = int(os.getenv('OPENFOODFACTS_REVALIDATE_CONCURRENCY', '4'))
+    OPENFOODFACTS_BATCH_CONCURRENCY = int(os.getenv('OPENFOODFACTS_BATCH_CONCURRENCY', '8'))
+    OPENFOODFACTS_CACHE_PATH = os.getenv('OPENFOODFACTS_CACHE_PATH', '/app/data/product_cache.db')
+    OPENFOODFACTS_PERSISTENT_CACHE_HOURS = int(os.getenv('OPENFOODFACTS_PERSISTENT_CACHE_HOURS', '168'))
+    
+    # Локальная копия дампа Open Food Facts (см. off_import.py)
+    OPENFOODFACTS_PRODUCT_STORE_PATH = os.getenv('OPENFOODFACTS_PRODUCT_STORE_PATH', '/app/data/products.db')
+    OPENFOODFACTS_BARCODE_INDEX_PATH = os.getenv('OPENFOODFACTS_BARCODE_INDEX_PATH', '/app/data/products.barcodes')
+    
+    # Порог сходства (0..1) для нечеткого поиска продуктов по триграммам
+    FUZZY_MATCH_THRESHOLD = float(os.getenv('FUZZY_MATCH_THRESHOLD', '0.75'))
+    
+    # Цепочка источников для get_product_info (по порядку, до первого найденного продукта)
+    # и таймауты отдельных уровней в секундах (уровень:секунды через запятую)
+    PRODUCT_RESOLVER_CHAIN = os.getenv(
+        'PRODUCT_RESOLVER_CHAIN', 'cache,fuzzy,store,local,openfoodfacts,local_approx,estimate'
+    )
+    PRODUCT_RESOLVER_TIMEOUTS = os.getenv('PRODUCT_RESOLVER_TIMEOUTS', 'store:1,openfoodfacts:8')
+    
+    # Общий срок (секунды) на поиск всех ингредиентов в analyze_meal
+    MEAL_ANALYSIS_DEADLINE = float(os.getenv('MEAL_ANALYSIS_DEADLINE', '8'))
+    
+    # Доля калорий исходного продукта, выше которой замена не предлагается (/alternatives)
+    ALTERNATIVES_MAX_CALORIE_RATIO = float(os.getenv('ALTERNATIVES_MAX_CALORIE_RATIO', '0.7'))
+    
+    # Прогрев кэша при запуске: сколько популярных продуктов и как часто повторять (0 - только при запуске)
+    WARMUP_TOP_N = int(os.getenv('WARMUP_TOP_N', '100'))
+    WARMUP_INTERVAL_HOURS = float(os.getenv('WARMUP_INTERVAL_HOURS', '0'))
     
 
     
+    # Пакетная запись дневника (еда, вода, вес): строки копятся до
+    # WRITE_BEHIND_MAX_ROWS штук или WRITE_BEHIND_DELAY_MS миллисекунд
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'False').lower() == 'true'
+    WRITE_BEHIND_MAX_ROWS = int(os.getenv('WRITE_BEHIND_MAX_ROWS', '100'))
+    WRITE_BEHIND_DELAY_MS = float(os.getenv('WRITE_BEHIND_DELAY_MS', '20'))
+    
+    # Номер процесса (0-1023) в идентификаторах строк YDB: у каждого
+    # одновременно работающего экземпляра бота он должен быть свой
+    ID_WORKER_ID = int(os.getenv('ID_WORKER_ID', '0'))
+    
     # Параметры расчета
     WATER_MULTIPLIER = 35
     
@@ -1,10 +1,164 @@
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 import asyncio
+from config import Config
 from ydb_client import ydb_client
+from id_allocator import id_generator
+
+
+class WriteBehindBuffer:
+    """
+    Пакетная вставка строк одной таблицы
+    
+    Строки копятся до max_rows штук или delay_seconds секунд и пишутся
+    одним запросом UPSERT ... SELECT FROM AS_TABLE($rows) вместо
+    отдельной транзакции на каждую. Вызвавший add ждет фиксации своего
+    пакета, поэтому ошибка записи доходит до обработчика, как и раньше.
+    flush(user_id) сразу отправляет и дожидается строк пользователя,
+    чтобы чтение видело его собственные записи.
+    """
+    
+    def __init__(self, table: str, columns: Sequence[Tuple[str, str]],
+                 max_rows: int = 100, delay_seconds: float = 0.02):
+        self.table = table
+        self.columns = columns
+        self.max_rows = max_rows
+        self.delay_seconds = delay_seconds
+        self.query = f"""
+            DECLARE $rows AS List<Struct<{', '.join(f'{name}: {type_}' for name, type_ in columns)}>>;
+            UPSERT INTO {table} SELECT * FROM AS_TABLE($rows);
+            """
+        
+        self._rows: List[Dict] = []
+        self._users = set()
+        self._batch: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: List[Tuple[set, asyncio.Future]] = []
+        self._tasks = set()
+        self.flushes = 0
+        self.rows_written = 0
+    
+    def _typed(self, row: Dict) -> Dict:
+        # Float-столбцы приходят и как int (например, 0 по умолчанию)
+        return {
+            name: float(row[name]) if type_.startswith('Float') and row[name] is not None else row[name]
+            for name, type_ in self.columns
+        }
+    
+    async def add(self, row: Dict):
+        """Добавить строку и дождаться записи ее пакета"""
+        loop = asyncio.get_running_loop()
+        self._rows.append(self._typed(row))
+        self._users.add(row['user_id'])
+        
+        if self._batch is None:
+            self._batch = loop.create_future()
+            self._timer = loop.call_later(self.delay_seconds, self._start_flush)
+        batch = self._batch
+        
+        if len(self._rows) >= self.max_rows:
+            self._start_flush()
+        
+        # Отмена одного обработчика не должна отменять запись всего пакета
+        await asyncio.shield(batch)
+    
+    def _start_flush(self):
+        if not self._rows:
+            return
+        
+        rows, users, batch = self._rows, self._users, self._batch
+        self._rows, self._users, self._batch = [], set(), None
+        self._timer.cancel()
+        self._timer = None
+        
+        entry = (users, batch)
+        self._in_flight.append(entry)
+        task = asyncio.ensure_future(self._write(rows, batch, entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _write(self, rows: List[Dict], batch: asyncio.Future, entry: Tuple[set, asyncio.Future]):
+        try:
+            await ydb_client.execute_query(self.query, {"rows": rows})
+            self.flushes += 1
+            self.rows_written += len(rows)
+            if not batch.done():
+                batch.set_result(len(rows))
+        except Exception as e:
+            print(f"Error in bulk insert into {self.table}: {e}")
+            if not batch.done():
+                batch.set_exception(e)
+                # Исключение получают ожидающие add; помечаем его полученным,
+                # даже если все они уже отменены
+                batch.exception()
+        finally:
+            self._in_flight.remove(entry)
+    
+    async def flush(self, user_id: Optional[int] = None):
+        """Записать накопленное и дождаться строк пользователя (или всех)"""
+        if self._rows and (user_id is None or user_id in self._users):
+            self._start_flush()
+        
+        waiting = [batch for users, batch in self._in_flight if user_id is None or user_id in users]
+        if waiting:
+            # shield: отмена читающего не должна отменять пакеты, которых ждут add
+            await asyncio.gather(*(asyncio.shield(batch) for batch in waiting), return_exceptions=True)
+
+
+# Столбцы пакетной вставки по таблицам (типы YDB для DECLARE)
+WRITE_BEHIND_COLUMNS = {
+    'food_entries': (
+        ('id', 'Uint64'), ('user_id', 'Uint64'), ('food_name', 'Utf8'), ('meal_type', 'Utf8?'),
+        ('calories', 'Float'), ('protein', 'Float'), ('fat', 'Float'), ('carbs', 'Float'),
+        ('quantity', 'Float'), ('date', 'Timestamp'),
+    ),
+    'water_intake': (
+        ('id', 'Uint64'), ('user_id', 'Uint64'), ('amount', 'Float'), ('date', 'Timestamp'),
+    ),
+    'weight_history': (
+        ('id', 'Uint64'), ('user_id', 'Uint64'), ('weight', 'Float'), ('date', 'Timestamp'),
+    ),
+}
+
 
 class DatabaseManager:
     
+    # Буферы пакетной вставки по таблицам (при WRITE_BEHIND_ENABLED)
+    write_buffers: Dict[str, WriteBehindBuffer] = {}
+    
+    @staticmethod
+    def _write_buffer(table: str) -> Optional[WriteBehindBuffer]:
+        """Буфер пакетной вставки таблицы или None, если она выключена"""
+        if not Config.WRITE_BEHIND_ENABLED:
+            return None
+        buffer = DatabaseManager.write_buffers.get(table)
+        if buffer is None:
+            buffer = WriteBehindBuffer(
+                table,
+                WRITE_BEHIND_COLUMNS[table],
+                max_rows=Config.WRITE_BEHIND_MAX_ROWS,
+                delay_seconds=Config.WRITE_BEHIND_DELAY_MS / 1000
+            )
+            DatabaseManager.write_buffers[table] = buffer
+        return buffer
+    
+    @staticmethod
+    async def _insert(table: str, query: str, row: Dict):
+        """Вставка строки: через буфер пакетной вставки или отдельным запросом"""
+        buffer = DatabaseManager._write_buffer(table)
+        if buffer is not None:
+            await buffer.add(row)
+        else:
+            await ydb_client.execute_query(query, row)
+    
+    @staticmethod
+    async def flush_writes(user_id: Optional[int] = None, tables: Sequence[str] = tuple(WRITE_BEHIND_COLUMNS)):
+        """Дождаться буферизованных вставок пользователя (или всех) перед чтением"""
+        for table in tables:
+            buffer = DatabaseManager.write_buffers.get(table)
+            if buffer is not None:
+                await buffer.flush(user_id)
+    
     @staticmethod
     async def get_or_create_user(telegram_id: int, username: str = None, full_name: str = None):
         """Получить или создать пользователя в YDB"""
@@ -22,11 +176,7 @@ class DatabaseManager:
                 return result[0]
             
             # Создаем нового пользователя
-            user_id_query = """
-            SELECT MAX(id) as max_id FROM users
-            """
-            max_id_result = await ydb_client.execute_query(user_id_query)
-            new_id = (max_id_result[0].get('max_id') or 0) + 1 if max_id_result else 1
+            new_id = id_generator.next_id()
             
             insert_query = """
             INSERT INTO users (id, telegram_id, username, full_name, created_at)
@@ -90,12 +240,8 @@ class DatabaseManager:
     async def add_food_entry(user_id: int, food_data: Dict):
         """Добавить запись о приеме пищи в YDB"""
         try:
-            # Генерируем ID
-            id_query = """
-            SELECT MAX(id) as max_id FROM food_entries
-            """
-            max_id_result = await ydb_client.execute_query(id_query)
-            new_id = (max_id_result[0].get('max_id') or 0) + 1 if max_id_result else 1
+            # Генерируем ID без обращения к таблице
+            new_id = id_generator.next_id()
             
             query = """
             INSERT INTO food_entries (
@@ -107,7 +253,7 @@ class DatabaseManager:
             )
             """
             
-            await ydb_client.execute_query(query, {
+            await DatabaseManager._insert('food_entries', query, {
                 "id": new_id,
                 "user_id": user_id,
                 "food_name": food_data.get('food_name', ''),
@@ -130,6 +276,8 @@ class DatabaseManager:
     async def get_today_stats(user_id: int):
         """Получить статистику за сегодня из YDB"""
         try:
+            await DatabaseManager.flush_writes(user_id, ('food_entries', 'water_intake'))
+            
             today = datetime.utcnow().date()
             tomorrow = today + timedelta(days=1)
             
@@ -183,18 +331,14 @@ class DatabaseManager:
     async def add_water_intake(user_id: int, amount: float):
         """Добавить запись о воде в YDB"""
         try:
-            id_query = """
-            SELECT MAX(id) as max_id FROM water_intake
-            """
-            max_id_result = await ydb_client.execute_query(id_query)
-            new_id = (max_id_result[0].get('max_id') or 0) + 1 if max_id_result else 1
+            new_id = id_generator.next_id()
             
             query = """
             INSERT INTO water_intake (id, user_id, amount, date)
             VALUES ($id, $user_id, $amount, $date)
             """
             
-            await ydb_client.execute_query(query, {
+            await DatabaseManager._insert('water_intake', query, {
                 "id": new_id,
                 "user_id": user_id,
                 "amount": amount,
@@ -211,18 +355,14 @@ class DatabaseManager:
     async def add_weight_record(user_id: int, weight: float):
         """Добавить запись о весе в YDB"""
         try:
-            id_query = """
-            SELECT MAX(id) as max_id FROM weight_history
-            """
-            max_id_result = await ydb_client.execute_query(id_query)
-            new_id = (max_id_result[0].get('max_id') or 0) + 1 if max_id_result else 1
+            new_id = id_generator.next_id()
             
             query = """
             INSERT INTO weight_history (id, user_id, weight, date)
             VALUES ($id, $user_id, $weight, $date)
             """
             
-            await ydb_client.execute_query(query, {
+            await DatabaseManager._insert('weight_history', query, {
                 "id": new_id,
                 "user_id": user_id,
                 "weight": weight,
@@ -259,6 +399,8 @@ class DatabaseManager:
     async def get_weight_history(user_id: int, days: int = 30):
         """Получить историю веса из YDB"""
         try:
+            await DatabaseManager.flush_writes(user_id, ('weight_history',))
+            
             start_date = datetime.utcnow() - timedelta(days=days)
             
             query = """
@@ -281,6 +423,8 @@ class DatabaseManager:
     async def get_food_history(user_id: int, days: int = 7):
         """Получить историю питания из YDB"""
         try:
+            await DatabaseManager.flush_writes(user_id, ('food_entries',))
+            
             start_date = datetime.utcnow() - timedelta(days=days)
             
             query = """
@@ -297,4 +441,26 @@ class DatabaseManager:
             
         except Exception as e:
             print(f"Error in get_food_history: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    @staticmethod
+    async def get_popular_foods(limit: int = 100):
+        """Самые частые названия продуктов в дневниках пользователей"""
+        try:
+            await DatabaseManager.flush_writes(tables=('food_entries',))
+            
+            query = """
+            SELECT food_name, COUNT(*) AS entries FROM food_entries
+            WHERE food_name IS NOT NULL AND food_name != ""
+            GROUP BY food_name
+            ORDER BY entries DESC
+            LIMIT $limit
+            """
+            
+            return await ydb_client.execute_query(query, {
+                "limit": limit
+            })
+            
+        except Exception as e:
+            print(f"Error in get_popular_foods: {e}")
+            return []
@@ -2,14 +2,14 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import CallbackContext, ConversationHandler
 import asyncio
-import re
 import logging
 from datetime import datetime
 from typing import Dict, List
 
 from database import DatabaseManager
-from api_client import OpenFoodFactsAPI
+from api_client import AsyncOpenFoodFactsAPI
 from utils import NutritionCalculator
+from text_utils import KeywordMatcher, parse_quantity
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -17,11 +17,22 @@ logger = logging.getLogger(__name__)
 # Состояния для ConversationHandler
 AGE, GENDER, WEIGHT, HEIGHT, ACTIVITY, GOAL, CLIMATE = range(7)
 
+# Типы приема пищи в /add_food (при нескольких - первый по списку)
+MEAL_TYPE_MATCHER = KeywordMatcher({
+    meal_type: [meal_type] for meal_type in ('завтрак', 'обед', 'ужин', 'перекус')
+})
+
+# Простые реплики в чате (приветствие важнее прощания)
+CHAT_INTENT_MATCHER = KeywordMatcher({
+    'greeting': ['привет', 'здравствуй', 'добрый день', 'доброе утро', 'добрый вечер'],
+    'farewell': ['пока', 'до свидания', 'спасибо', 'благодарю'],
+})
+
 class BotHandlers:
     
     def __init__(self):
         self.db = DatabaseManager()
-        self.api = OpenFoodFactsAPI()
+        self.api = AsyncOpenFoodFactsAPI()
         self.calculator = NutritionCalculator()
     
     async def start(self, update: Update, context: CallbackContext):
@@ -82,6 +93,7 @@ class BotHandlers:
 🍽️ *Питание (Open Food Facts):*
 */add_food* [количество]г [продукт] - Добавить прием пищи
 */search* [продукт] - Найти продукт в базе
+*/alternatives* [продукт] - Более легкие альтернативы
 */today* - Статистика за сегодня
 */history* [дней] - История питания
 */macros* - Баланс БЖУ
@@ -426,39 +438,20 @@ class BotHandlers:
         )
         
         try:
-            # Парсим количество
-            quantity_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:г|грамм?|кг|л|мл)?', user_input.lower())
-            
-            if quantity_match:
-                quantity = float(quantity_match.group(1))
-                if 'кг' in user_input.lower():
-                    quantity *= 1000
-                elif 'л' in user_input.lower():
-                    quantity *= 1000
-                
-                product_text = re.sub(r'\d+(?:\.\d+)?\s*(?:г|грамм?|кг|л|мл)?', '', user_input, count=1).strip()
-            else:
-                quantity = 100
-                product_text = user_input
+            # Парсим количество (в граммах, по умолчанию 100 г)
+            quantity, product_text = parse_quantity(user_input)
             
             # Определяем тип приема пищи
-            meal_types = ['завтрак', 'обед', 'ужин', 'перекус']
-            meal_type = None
-            
-            for mt in meal_types:
-                if mt in product_text.lower():
-                    meal_type = mt
-                    product_text = product_text.lower().replace(mt, '').strip()
-                    break
+            meal_type = MEAL_TYPE_MATCHER.first_label(product_text)
+            if meal_type:
+                product_text = product_text.lower().replace(meal_type, '').strip()
             
             if not product_text:
                 await search_msg.edit_text("❌ Не указан продукт.")
                 return
             
             # Ищем продукт в Open Food Facts
-            product_info = await asyncio.to_thread(
-                self.api.get_product_info, product_text
-            )
+            product_info = await self.api.get_product_info(product_text)
             
             if not product_info or not product_info.success:
                 await search_msg.edit_text(
@@ -523,6 +516,7 @@ class BotHandlers:
             source_desc = {
                 'openfoodfacts': 'Open Food Facts 🌍',
                 'local_db': 'Локальная база 📚',
+                'local_db_fuzzy': 'Локальная база (похожее название) 📚',
                 'estimation': 'Оценка 🤔'
             }.get(product_info.source, product_info.source)
             
@@ -559,9 +553,7 @@ class BotHandlers:
         
         try:
             # Ищем продукты
-            products = await asyncio.to_thread(
-                self.api.search_product, query, 5
-            )
+            products = await self.api.search_product(query, 5)
             
             if not products:
                 await search_msg.edit_text(
@@ -841,9 +833,7 @@ class BotHandlers:
         )
         
         try:
-            product_info = await asyncio.to_thread(
-                self.api.get_product_info, product_name
-            )
+            product_info = await self.api.get_product_info(product_name)
             
             if not product_info or not product_info.success:
                 await search_msg.edit_text(
@@ -878,6 +868,12 @@ class BotHandlers:
 *Источник данных:* Open Food Facts 🌍
 """
             
+            alternatives = self.api.find_alternatives(product_info, k=3)
+            if alternatives:
+                response += "\n🥗 *Легче по калорийности:*\n"
+                for alternative in alternatives:
+                    response += f"• {alternative.name} - {alternative.calories:.0f} ккал\n"
+            
             await search_msg.edit_text(response, parse_mode=ParseMode.MARKDOWN)
             
         except Exception as e:
@@ -886,6 +882,57 @@ class BotHandlers:
                 "❌ Ошибка при получении информации о продукте."
             )
     
+    async def alternatives(self, update: Update, context: CallbackContext):
+        """Похожие продукты с меньшей калорийностью"""
+        if not context.args:
+            await update.message.reply_text(
+                "🥗 *Более легкие альтернативы*\n\n"
+                "Формат: `/alternatives [продукт]`\n\n"
+                "*Примеры:*\n"
+                "• `/alternatives сыр`\n"
+                "• `/alternatives свинина`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        product_name = ' '.join(context.args)
+        
+        try:
+            product_info = await self.api.get_product_info(product_name)
+            
+            if not product_info or not product_info.success:
+                await update.message.reply_text(
+                    f"❌ Не удалось найти информацию о продукте: {product_name}"
+                )
+                return
+            
+            alternatives = self.api.find_alternatives(product_info)
+            
+            if not alternatives:
+                await update.message.reply_text(
+                    f"🤷 Не нашлось похожих продуктов легче, чем {product_info.name} "
+                    f"({product_info.calories:.0f} ккал на 100г)."
+                )
+                return
+            
+            response = (
+                f"🥗 *Легче, чем {product_info.name}* "
+                f"({product_info.calories:.0f} ккал на 100г):\n\n"
+            )
+            for alternative in alternatives:
+                response += (
+                    f"• *{alternative.name}* - {alternative.calories:.0f} ккал, "
+                    f"Б {alternative.protein:.1f} / Ж {alternative.fat:.1f} / У {alternative.carbs:.1f}\n"
+                )
+            
+            await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
+            
+        except Exception as e:
+            logger.error(f"Error finding alternatives: {e}")
+            await update.message.reply_text(
+                "❌ Ошибка при поиске альтернатив."
+            )
+    
     async def progress_tracking(self, update: Update, context: CallbackContext):
         """Отслеживание прогресса"""
         user_id = update.effective_user.id
@@ -1122,15 +1169,12 @@ class BotHandlers:
     
     async def handle_message(self, update: Update, context: CallbackContext):
         """Обработка текстовых сообщений"""
-        text = update.message.text.lower()
-        
         # Простые ответы
-        greetings = ['привет', 'здравствуй', 'добрый день', 'доброе утро', 'добрый вечер']
-        farewells = ['пока', 'до свидания', 'спасибо', 'благодарю']
+        intent = CHAT_INTENT_MATCHER.first_label(update.message.text)
         
-        if any(greet in text for greet in greetings):
+        if intent == 'greeting':
             await update.message.reply_text(f"Привет, {update.effective_user.first_name}! Чем могу помочь?")
-        elif any(farewell in text for farewell in farewells):
+        elif intent == 'farewell':
             await update.message.reply_text("Всегда рад помочь! Обращайтесь!")
         else:
             await update.message.reply_text(
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import config
+
+# Эпоха идентификаторов: 2025-01-01 00:00:00 UTC в миллисекундах
+ID_EPOCH_MS = 1735689600000
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeIdGenerator:
+    """
+    Генератор уникальных идентификаторов строк без обращения к базе
+
+    Идентификатор - 63-битное число: миллисекунды от ID_EPOCH_MS
+    (41 бит, хватит примерно на 69 лет), номер процесса worker_id
+    (10 бит) и порядковый номер внутри миллисекунды (12 бит, до 4096
+    идентификаторов в миллисекунду). Идентификаторы растут со временем
+    и не совпадают у процессов с разными worker_id, поэтому вставка
+    не требует SELECT MAX(id) и не конфликтует с параллельными
+    записями. Помещается и в Uint64, и в Int64.
+    """
+
+    def __init__(self, worker_id: int = 0, epoch_ms: int = ID_EPOCH_MS):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be in [0, {MAX_WORKER_ID}], got {worker_id}")
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _now_ms(self) -> int:
+        return time.time_ns() // 1_000_000 - self.epoch_ms
+
+    def next_id(self) -> int:
+        with self._lock:
+            now = self._now_ms()
+
+            # Та же миллисекунда или часы отстали (коррекция NTP): продолжаем
+            # последовательность последней выданной, чтобы не повторить идентификатор
+            if now <= self._last_ms:
+                now = self._last_ms
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Номера миллисекунды исчерпаны: занимаем следующую, а не ждем
+                    # ее в цикле - генератор вызывается и из event loop
+                    now += 1
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+# Общий генератор процесса (номер процесса задается ID_WORKER_ID)
+id_generator = SnowflakeIdGenerator(config.Config.ID_WORKER_ID)
@@ -0,0 +1,51 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+def intern_text(value: Optional[str]) -> Optional[str]:
+    """Общий экземпляр часто повторяющейся строки (бренды, категории)"""
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True, frozen=True)
+class ProductInfo:
+    """
+    Информация о продукте
+
+    Экземпляры неизменяемы и без __dict__: один объект можно безопасно
+    держать одновременно в нескольких кэшах.
+    """
+    name: str
+    calories: float
+    protein: float
+    fat: float
+    carbs: float
+    fiber: Optional[float] = None
+    sugar: Optional[float] = None
+    salt: Optional[float] = None
+    serving_size_g: float = 100
+    source: str = "openfoodfacts"
+    success: bool = True
+    barcode: Optional[str] = None
+    brands: Optional[str] = None
+    categories: Optional[str] = None
+    nova_group: Optional[int] = None  # 1-4 (1 - минимальная обработка, 4 - ультраобработанный)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProductInfo':
+        """Продукт из сериализованного словаря (кэш, хранилище, индекс)"""
+        data = dict(data)
+        for field in ('source', 'brands', 'categories'):
+            if field in data:
+                data[field] = intern_text(data[field])
+        return cls(**data)
+
+
+@dataclass
+class BarcodeLookup:
+    """Результат поиска одного штрих-кода в пакетном запросе"""
+    barcode: str
+    product: Optional[ProductInfo]
+    status: str  # cached, local, found, not_found, error
+    error: Optional[str] = None
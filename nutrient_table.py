@@ -0,0 +1,231 @@
+import sys
+import threading
+from typing import Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models import ProductInfo
+
+# Числовые поля ProductInfo - столбцы матрицы (None хранится как NaN)
+NUTRIENT_COLUMNS = (
+    'calories', 'protein', 'fat', 'carbs', 'fiber', 'sugar', 'salt', 'serving_size_g',
+)
+
+# Столбцы, по которым сравниваются продукты при поиске похожих (первые в матрице)
+SIMILARITY_COLUMNS = NUTRIENT_COLUMNS[:6]
+
+
+class StringPool:
+    """Словарь строк: каждая строка хранится один раз, в таблице - ее номер"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._values: List[Optional[str]] = [None]  # 0 - отсутствующее значение
+
+    def __len__(self) -> int:
+        return len(self._values) - 1
+
+    def code(self, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        code = self._ids.get(value)
+        if code is None:
+            code = len(self._values)
+            self._ids[value] = code
+            self._values.append(sys.intern(value))
+        return code
+
+    def value(self, code: int) -> Optional[str]:
+        return self._values[code]
+
+    def find(self, value: Optional[str]) -> Optional[int]:
+        """Номер строки без добавления в словарь; None, если ее там нет"""
+        return self._ids.get(value) if value else 0
+
+
+class NutrientTable:
+    """
+    Компактное хранилище большого числа продуктов (struct-of-arrays)
+
+    Пищевая ценность лежит в одной матрице float32 (строка - продукт,
+    столбец - NUTRIENT_COLUMNS), бренды, категории и источники
+    заменены номерами в общих словарях строк. Объект ProductInfo
+    создается только при чтении, поэтому на продукт приходится около
+    полусотни байт вместо нескольких сотен у отдельного объекта.
+
+    Доступ по ключу (штрих-код или название). При заданном max_rows
+    таблица работает как кольцевой буфер: новая запись занимает
+    строку самой старой.
+    """
+
+    def __init__(self, max_rows: Optional[int] = None, initial_capacity: int = 1024):
+        self.max_rows = max_rows
+        capacity = min(initial_capacity, max_rows) if max_rows else initial_capacity
+        self._values = np.full((capacity, len(NUTRIENT_COLUMNS)), np.nan, dtype=np.float32)
+        self._nova = np.zeros(capacity, dtype=np.int8)
+        self._brands = np.zeros(capacity, dtype=np.int32)
+        self._categories = np.zeros(capacity, dtype=np.int32)
+        self._sources = np.zeros(capacity, dtype=np.int32)
+        self._groups = np.zeros(capacity, dtype=np.int32)
+        self._names: List[Optional[str]] = []
+        self._barcodes: List[Optional[str]] = []
+        self._keys: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._next = 0  # следующая вытесняемая строка заполненного буфера
+        self._lock = threading.Lock()
+
+        self.brands = StringPool()
+        self.categories = StringPool()
+        self.sources = StringPool()
+        self.groups = StringPool()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        """Размер числовых массивов в байтах"""
+        return sum(array.nbytes for array in (
+            self._values, self._nova, self._brands, self._categories, self._sources, self._groups
+        ))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Матрица пищевой ценности занятых строк (без копирования)"""
+        return self._values[:len(self._keys)]
+
+    def column(self, name: str) -> np.ndarray:
+        """Столбец одного питательного вещества по всем строкам"""
+        return self.matrix[:, NUTRIENT_COLUMNS.index(name)]
+
+    def keys(self) -> List[str]:
+        """Ключи в порядке строк"""
+        with self._lock:
+            return list(self._keys)
+
+    def _grow(self):
+        capacity = len(self._values) * 2
+        if self.max_rows:
+            capacity = min(capacity, self.max_rows)
+
+        values = np.full((capacity, len(NUTRIENT_COLUMNS)), np.nan, dtype=np.float32)
+        values[:len(self._values)] = self._values
+        self._values = values
+        for name in ('_nova', '_brands', '_categories', '_sources', '_groups'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _allocate_row(self) -> int:
+        """Номер свободной строки (с вытеснением при заполненном буфере)"""
+        used = len(self._keys)
+        if self.max_rows is None or used < self.max_rows:
+            if used == len(self._values):
+                self._grow()
+            self._keys.append(None)
+            self._names.append(None)
+            self._barcodes.append(None)
+            return used
+
+        row = self._next
+        self._next = (self._next + 1) % self.max_rows
+        del self._rows[self._keys[row]]
+        return row
+
+    def add(self, key: str, product: ProductInfo, group: Optional[str] = None) -> int:
+        """
+        Добавить или обновить продукт, вернуть номер его строки
+
+        group - укрупненная категория продукта для поиска похожих.
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._allocate_row()
+                self._rows[key] = row
+                self._keys[row] = key
+
+            self._values[row] = [
+                np.nan if getattr(product, column) is None else getattr(product, column)
+                for column in NUTRIENT_COLUMNS
+            ]
+            self._nova[row] = product.nova_group or 0
+            self._brands[row] = self.brands.code(product.brands)
+            self._categories[row] = self.categories.code(product.categories)
+            self._sources[row] = self.sources.code(product.source)
+            self._groups[row] = self.groups.code(group)
+            self._names[row] = product.name
+            self._barcodes[row] = product.barcode
+            return row
+
+    def nearest(self, vector: np.ndarray, scale: np.ndarray, k: int, group: Optional[str] = None,
+                max_calories: Optional[float] = None,
+                exclude: Collection[str] = ()) -> List[Tuple[float, str]]:
+        """
+        k ближайших продуктов: (расстояние, ключ) по возрастанию расстояния
+
+        Расстояние евклидово по SIMILARITY_COLUMNS, деленным на scale;
+        неизвестные значения (NaN) в сравнении не участвуют. Кандидаты
+        сначала отбираются по группе и калорийности.
+        """
+        with self._lock:
+            used = len(self._keys)
+            values = self._values[:used, :len(SIMILARITY_COLUMNS)]
+            mask = np.ones(used, dtype=bool)
+
+            if group is not None:
+                code = self.groups.find(group)
+                if code is None:
+                    return []
+                mask &= self._groups[:used] == code
+            if max_calories is not None:
+                mask &= values[:, 0] <= max_calories
+
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+
+            differences = np.nan_to_num((values[rows] - vector) / scale)
+            distances = np.sqrt((differences * differences).sum(axis=1))
+
+            take = min(len(rows), k + len(exclude))
+            closest = np.argpartition(distances, take - 1)[:take]
+            closest = closest[np.argsort(distances[closest])]
+
+            found = [(float(distances[i]), self._keys[rows[i]]) for i in closest]
+        return [item for item in found if item[1] not in exclude][:k]
+
+    def row_of(self, key: str) -> Optional[int]:
+        return self._rows.get(key)
+
+    def get(self, key: str) -> Optional[ProductInfo]:
+        """Продукт по ключу или None"""
+        with self._lock:
+            row = self._rows.get(key)
+            return None if row is None else self._product(row)
+
+    def product(self, row: int) -> ProductInfo:
+        """Продукт по номеру строки"""
+        with self._lock:
+            return self._product(row)
+
+    def _product(self, row: int) -> ProductInfo:
+        # float32 хранит 0.8 как 0.800000011920929, поэтому округляем
+        values = [None if np.isnan(value) else round(float(value), 3) for value in self._values[row]]
+        nutrients = dict(zip(NUTRIENT_COLUMNS, values))
+        nova_group = int(self._nova[row])
+
+        return ProductInfo(
+            name=self._names[row],
+            success=True,
+            barcode=self._barcodes[row],
+            brands=self.brands.value(self._brands[row]),
+            categories=self.categories.value(self._categories[row]),
+            source=self.sources.value(self._sources[row]),
+            nova_group=nova_group or None,
+            **nutrients
+        )
@@ -0,0 +1,153 @@
+"""
+Импорт дампа Open Food Facts в локальное хранилище продуктов
+
+Дамп (JSONL или CSV, можно в .gz) читается построчно, без загрузки
+в память. Каждый продукт разбирается теми же правилами, что и ответы
+API (OpenFoodFactsAPI._parse_product_data).
+
+Использование:
+    python off_import.py openfoodfacts-products.jsonl.gz
+    python off_import.py en.openfoodfacts.org.products.csv.gz --output /app/data/products.db
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, Optional
+
+from api_client import OpenFoodFactsAPI
+from barcode_index import BarcodeIndex
+from config import Config
+from product_store import LocalProductStore
+
+logger = logging.getLogger(__name__)
+
+# Текстовые поля CSV-дампа, которые нужны парсеру
+CSV_TEXT_FIELDS = (
+    'code', 'product_name', 'product_name_ru', 'generic_name', 'generic_name_ru',
+    'brands', 'categories', 'nova_group',
+)
+
+
+def open_dump(path: str) -> io.TextIOBase:
+    """Открыть дамп как текстовый поток (с распаковкой .gz)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def iter_jsonl(stream: io.TextIOBase) -> Iterator[Optional[Dict]]:
+    """Продукты из JSONL-дампа; None для испорченных строк"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def csv_row_to_product_data(row: Dict[str, str]) -> Dict:
+    """Привести строку CSV-дампа к структуре продукта из API"""
+    product_data = {field: row.get(field) or None for field in CSV_TEXT_FIELDS}
+
+    nutriments = {}
+    for column, value in row.items():
+        if column and column.endswith('_100g') and value:
+            try:
+                nutriments[column] = float(value)
+            except ValueError:
+                continue
+    product_data['nutriments'] = nutriments
+
+    return product_data
+
+
+def iter_csv(stream: io.TextIOBase) -> Iterator[Optional[Dict]]:
+    """Продукты из CSV-дампа (разделитель - табуляция)"""
+    csv.field_size_limit(sys.maxsize)
+    for row in csv.DictReader(stream, delimiter='\t', quoting=csv.QUOTE_NONE):
+        yield csv_row_to_product_data(row)
+
+
+def import_dump(dump_path: str, output_path: str, batch_size: int = 5000,
+                barcode_index_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Импортировать дамп в хранилище
+
+    Хранилище собирается во временном файле и атомарно заменяет
+    старое, поэтому работающий бот не видит частично записанные данные.
+    Если указан barcode_index_path, дополнительно строится
+    mmap-индекс по штрих-кодам (см. barcode_index.py).
+    """
+    is_csv = '.csv' in os.path.basename(dump_path)
+    tmp_path = f"{output_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    store = LocalProductStore.create(tmp_path)
+    stats = {'read': 0, 'imported': 0, 'skipped': 0}
+    batch = []
+
+    with open_dump(dump_path) as stream:
+        records = iter_csv(stream) if is_csv else iter_jsonl(stream)
+
+        for product_data in records:
+            stats['read'] += 1
+            product_info = None
+            if product_data and product_data.get('code'):
+                product_info = OpenFoodFactsAPI._parse_product_data(product_data)
+
+            if product_info is None:
+                stats['skipped'] += 1
+                continue
+
+            batch.append(product_info)
+            if len(batch) >= batch_size:
+                stats['imported'] += store.add_many(batch)
+                batch.clear()
+
+            if stats['read'] % 100000 == 0:
+                logger.info(f"Processed {stats['read']} products, imported {stats['imported']}")
+
+    if batch:
+        stats['imported'] += store.add_many(batch)
+
+    store.finalize()
+    if barcode_index_path:
+        stats['barcodes'] = BarcodeIndex.build(barcode_index_path, store.iter_barcode_records())
+    store.close()
+    os.replace(tmp_path, output_path)
+
+    logger.info(
+        f"Import finished: read {stats['read']}, imported {stats['imported']}, "
+        f"skipped {stats['skipped']}"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт дампа Open Food Facts')
+    parser.add_argument('dump', help='Путь к дампу (.jsonl, .csv, можно .gz)')
+    parser.add_argument('--output', default=Config.OPENFOODFACTS_PRODUCT_STORE_PATH,
+                        help='Файл локального хранилища продуктов')
+    parser.add_argument('--barcode-index', default=Config.OPENFOODFACTS_BARCODE_INDEX_PATH,
+                        help='Базовый путь mmap-индекса штрих-кодов (.idx/.dat); пустая строка - не строить')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    import_dump(args.dump, args.output, args.batch_size, args.barcode_index or None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from models import ProductInfo
+
+logger = logging.getLogger(__name__)
+
+# Маркер промаха кэша (None и [] - допустимые закэшированные значения)
+MISSING = object()
+
+
+def is_negative_result(value: Any) -> bool:
+    """Пустой результат поиска или ненайденный штрих-код"""
+    return value is None or (isinstance(value, list) and not value)
+
+
+def encode_cache_value(value: Any) -> str:
+    """Сериализация результата поиска (список, продукт или None) в JSON"""
+    if value is None:
+        payload = {'type': 'none'}
+    elif isinstance(value, ProductInfo):
+        payload = {'type': 'product', 'value': asdict(value)}
+    else:
+        payload = {'type': 'list', 'value': [asdict(item) for item in value]}
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def decode_cache_value(raw: str) -> Any:
+    """Обратное преобразование для encode_cache_value"""
+    payload = json.loads(raw)
+    if payload['type'] == 'none':
+        return None
+    if payload['type'] == 'product':
+        return ProductInfo.from_dict(payload['value'])
+    return [ProductInfo.from_dict(item) for item in payload['value']]
+
+
+class PersistentProductCache:
+    """
+    Постоянный кэш результатов Open Food Facts в SQLite (режим WAL)
+
+    Переживает перезапуски бота: после деплоя повторные запросы
+    обслуживаются с диска, а не через сеть. База открывается лениво
+    при первом обращении, у каждой записи свой срок жизни.
+    """
+
+    def __init__(self, path: str, default_ttl_seconds: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.default_ttl_seconds = default_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Ленивое открытие базы; при ошибке кэш отключается"""
+        if self._conn is not None or self._disabled:
+            return self._conn
+
+        try:
+            if not self.path.parent.exists():
+                raise FileNotFoundError(f"directory {self.path.parent} does not exist")
+
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS product_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stored_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(product_cache)")]
+            if 'stored_at' not in columns:
+                # Кэш прежней версии: возраст записей неизвестен, считаем их старыми
+                conn.execute("ALTER TABLE product_cache ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+            conn.execute("DELETE FROM product_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            self._conn = conn
+            logger.info(f"Persistent product cache opened: {self.path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Persistent product cache disabled: {e}")
+            self._disabled = True
+
+        return self._conn
+
+    def get(self, key: str) -> Any:
+        """Получить значение или MISSING, если записи нет или она устарела"""
+        value, age = self.get_with_age(key)
+        return value
+
+    def get_with_age(self, key: str):
+        """Получить (значение, возраст записи в секундах) или (MISSING, None)"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                self.misses += 1
+                return MISSING, None
+
+            try:
+                row = conn.execute(
+                    "SELECT value, expires_at, stored_at FROM product_cache WHERE key = ?", (key,)
+                ).fetchone()
+
+                now = time.time()
+                if row is None:
+                    self.misses += 1
+                    return MISSING, None
+
+                if row[1] <= now:
+                    conn.execute("DELETE FROM product_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    self.misses += 1
+                    return MISSING, None
+
+                value = decode_cache_value(row[0])
+            except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Error reading persistent cache: {e}")
+                self.misses += 1
+                return MISSING, None
+
+            self.hits += 1
+            return value, now - row[2]
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Сохранить значение с собственным сроком жизни"""
+        ttl = self.default_ttl_seconds if ttl_seconds is None else ttl_seconds
+
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO product_cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+                    (key, encode_cache_value(value), time.time() + ttl, time.time())
+                )
+                conn.commit()
+            except (sqlite3.Error, TypeError) as e:
+                logger.error(f"Error writing persistent cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        """Закрыть соединение с базой"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ProductCache:
+    """
+    Ограниченный потокобезопасный LRU-кэш результатов Open Food Facts
+
+    Записи распределены по сегментам (lock striping), у каждого сегмента
+    свой замок и свой LRU-порядок, поэтому потоки asyncio.to_thread
+    не конкурируют за один общий замок. Сроки жизни задаются по типу
+    записи: поиск, штрих-код и отрицательный результат.
+
+    Положительные записи после истечения срока еще max_stale_seconds
+    остаются доступными как устаревшие (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: Optional[Dict[str, float]] = None,
+                 stripes: int = 16, max_stale_seconds: float = 0):
+        self.ttl_seconds = {'search': 3600, 'barcode': 24 * 3600, 'negative': 600}
+        if ttl_seconds:
+            self.ttl_seconds.update(ttl_seconds)
+
+        self.max_entries = max_entries
+        self.max_stale_seconds = max_stale_seconds
+        self._stripe_capacity = max(1, max_entries // stripes)
+        self._stripes = [OrderedDict() for _ in range(stripes)]
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._hits = [0] * stripes
+        self._misses = [0] * stripes
+        self._evictions = [0] * stripes
+        self._stale_hits = [0] * stripes
+
+    def _stripe(self, key: str) -> int:
+        return hash(key) % len(self._stripes)
+
+    def ttl_for(self, key: str, value: Any) -> float:
+        """Срок жизни записи в секундах в зависимости от ее типа"""
+        if is_negative_result(value):
+            return self.ttl_seconds['negative']
+        if key.startswith('barcode_'):
+            return self.ttl_seconds['barcode']
+        return self.ttl_seconds['search']
+
+    def get(self, key: str) -> Any:
+        """Получить свежее значение или MISSING"""
+        value, stale = self.get_with_state(key, allow_stale=False)
+        return value
+
+    def get_with_state(self, key: str, allow_stale: bool = True):
+        """
+        Получить (значение, устарело ли оно)
+
+        Устаревшее значение возвращается, пока не вышел предел
+        max_stale_seconds; дальше - (MISSING, False).
+        """
+        index = self._stripe(key)
+        stripe = self._stripes[index]
+        now = time.monotonic()
+
+        with self._locks[index]:
+            entry = stripe.get(key)
+            if entry is None:
+                self._misses[index] += 1
+                return MISSING, False
+
+            value, expires_at, stale_until = entry
+            if stale_until <= now:
+                del stripe[key]
+                self._misses[index] += 1
+                return MISSING, False
+
+            stale = expires_at <= now
+            if stale and not allow_stale:
+                self._misses[index] += 1
+                return MISSING, False
+
+            stripe.move_to_end(key)
+            if stale:
+                self._stale_hits[index] += 1
+            else:
+                self._hits[index] += 1
+            return value, stale
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Сохранить значение, вытесняя самые старые записи сегмента"""
+        ttl = self.ttl_for(key, value) if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl
+        stale_until = expires_at if is_negative_result(value) else expires_at + self.max_stale_seconds
+        index = self._stripe(key)
+        stripe = self._stripes[index]
+
+        with self._locks[index]:
+            stripe[key] = (value, expires_at, stale_until)
+            stripe.move_to_end(key)
+
+            while len(stripe) > self._stripe_capacity:
+                stripe.popitem(last=False)
+                self._evictions[index] += 1
+
+    def __contains__(self, key: str) -> bool:
+        index = self._stripe(key)
+        with self._locks[index]:
+            entry = self._stripes[index].get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def clear(self):
+        """Очистить все сегменты"""
+        for index, stripe in enumerate(self._stripes):
+            with self._locks[index]:
+                stripe.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер кэша и счетчики попаданий, промахов и вытеснений"""
+        hits = sum(self._hits)
+        misses = sum(self._misses)
+        total = hits + misses
+        return {
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'stale_hits': sum(self._stale_hits),
+            'evictions': sum(self._evictions),
+            'hit_ratio': hits / total if total else 0.0,
+        }
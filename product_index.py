@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from text_utils import number_tokens, query_key, stemmed_words, trigrams
+
+
+class LocalProductIndex:
+    """
+    Индексы локальной базы продуктов, строятся один раз при создании
+
+    - хэш-индекс точных названий (для поиска названия внутри запроса)
+    - ключи нормализованных названий (запрос целиком совпадает с продуктом)
+    - инвертированный индекс слово -> продукт (для частичных совпадений)
+
+    При нескольких совпадениях выигрывает продукт, стоящий раньше
+    в исходной базе, как и при последовательном переборе.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        names = list(names)
+        self._order = {name: position for position, name in enumerate(names)}
+        self._name_lengths = sorted({len(name) for name in names})
+
+        self._keys: Dict[str, str] = {}
+        for name in names:
+            self._keys.setdefault(query_key(name), name)
+
+        self._tokens: Dict[str, str] = {}
+        for name in names:
+            for word in name.split():
+                self._tokens.setdefault(word, name)
+
+    def _earliest(self, current: Optional[str], candidate: str) -> str:
+        if current is None or self._order[candidate] < self._order[current]:
+            return candidate
+        return current
+
+    def find_exact(self, query: str) -> Optional[str]:
+        """Продукт, совпадающий с запросом после нормализации ("гречки" -> "гречка")"""
+        return self._keys.get(query_key(query))
+
+    def find_in_query(self, query_lower: str) -> Optional[str]:
+        """
+        Продукт, название которого входит в запрос как подстрока
+
+        Проверяются только подстроки запроса тех длин, что встречаются
+        среди названий, поэтому время не зависит от размера базы.
+        """
+        found = None
+        query_length = len(query_lower)
+
+        for start in range(query_length):
+            for length in self._name_lengths:
+                if start + length > query_length:
+                    break
+                name = query_lower[start:start + length]
+                if name in self._order:
+                    found = self._earliest(found, name)
+
+        return found
+
+    def find_by_words(self, query_lower: str) -> Optional[str]:
+        """Продукт, у которого есть хотя бы одно общее слово с запросом"""
+        found = None
+
+        for word in set(query_lower.split()):
+            name = self._tokens.get(word)
+            if name is not None:
+                found = self._earliest(found, name)
+
+        return found
+
+
+class TrigramIndex:
+    """
+    Нечеткий поиск по триграммам основ слов
+
+    Ищет название, похожее на запрос (коэффициент Дайса по множествам
+    триграмм), через инвертированный индекс триграмма -> записи, поэтому
+    сравниваются только кандидаты с общими триграммами. При превышении
+    max_entries вытесняются самые старые записи, при заданном
+    max_age_seconds записи старше этого срока не находятся и удаляются.
+    Числа (жирность и т.п.) у запроса и записи должны совпадать точно:
+    "молоко 2,5%" не находит "молоко 3,5%", как бы ни были похожи триграммы.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove_oldest(self):
+        old_key, (old_grams, _, _, _) = self._entries.popitem(last=False)
+        for gram in old_grams:
+            keys = self._postings[gram]
+            keys.discard(old_key)
+            if not keys:
+                del self._postings[gram]
+
+    def _expire(self, now: float):
+        # Записи упорядочены по времени добавления: устаревшие - в начале
+        if self.max_age_seconds is None:
+            return
+        while self._entries and now - next(iter(self._entries.values()))[3] >= self.max_age_seconds:
+            self._remove_oldest()
+
+    def add(self, text: str, payload: Any):
+        """Добавить (или обновить) запись с текстом и связанным значением"""
+        key = ' '.join(stemmed_words(text))
+        grams = trigrams(text)
+        if not grams:
+            return
+        numbers = number_tokens(text)
+
+        with self._lock:
+            now = time.monotonic()
+            if key in self._entries:
+                self._entries[key] = (grams, numbers, payload, now)
+                self._entries.move_to_end(key)
+                return
+
+            self._entries[key] = (grams, numbers, payload, now)
+            for gram in grams:
+                self._postings[gram].add(key)
+
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._remove_oldest()
+            self._expire(now)
+
+    def search(self, query: str, threshold: float) -> Optional[Tuple[Any, float]]:
+        """Наиболее похожая запись (значение, оценка) с оценкой не ниже порога"""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return None
+        query_numbers = number_tokens(query)
+
+        with self._lock:
+            self._expire(time.monotonic())
+            common = defaultdict(int)
+            for gram in query_grams:
+                for key in self._postings.get(gram, ()):
+                    common[key] += 1
+
+            best = None
+            for key, shared in common.items():
+                grams, numbers, payload, _ = self._entries[key]
+                if numbers != query_numbers:
+                    continue
+                score = 2 * shared / (len(grams) + len(query_grams))
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (payload, score)
+
+        return best
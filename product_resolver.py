@@ -0,0 +1,159 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from models import ProductInfo
+
+logger = logging.getLogger(__name__)
+
+
+def parse_chain(spec: str) -> List[str]:
+    """Порядок уровней из строки вида 'cache,local,openfoodfacts'"""
+    return [name.strip() for name in spec.split(',') if name.strip()]
+
+
+def parse_timeouts(spec: str) -> Dict[str, float]:
+    """Таймауты уровней из строки вида 'store:0.5,openfoodfacts:8'"""
+    timeouts = {}
+    for item in spec.split(','):
+        name, _, seconds = item.partition(':')
+        if name.strip() and seconds.strip():
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+class ResolverTier:
+    """
+    Один уровень цепочки: функция query -> ProductInfo или None
+
+    Функция может быть корутиной (только в resolve_async). timeout
+    ограничивает время уровня: по его истечении цепочка переходит
+    к следующему уровню.
+    """
+
+    def __init__(self, name: str, fn: Callable[[str], Any], timeout: Optional[float] = None):
+        self.name = name
+        self.fn = fn
+        self.timeout = timeout
+        self.is_async = inspect.iscoroutinefunction(fn)
+
+        self.calls = 0
+        self.hits = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, product: Optional[ProductInfo]):
+        self.calls += 1
+        self.hits += product is not None
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class ResolverChain:
+    """
+    Цепочка источников информации о продукте
+
+    Уровни опрашиваются по порядку, первый найденный продукт
+    возвращается сразу, без обращения к следующим уровням. Дешевые
+    уровни (кэш, локальная база) ставятся первыми, сеть - ближе к
+    концу. По каждому уровню считаются обращения, попадания, таймауты,
+    ошибки и время, чтобы было видно, где тратится время поиска.
+    """
+
+    def __init__(self, tiers: Sequence[ResolverTier], max_workers: int = 8):
+        self.tiers = list(tiers)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+
+    def _run_with_timeout(self, tier: ResolverTier, query: str) -> Optional[ProductInfo]:
+        # Поток нельзя прервать: уровень дорабатывает в пуле, а его результат
+        # (например, ответ Open Food Facts) все равно попадет в кэш
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix='product-resolver'
+                )
+        return self._executor.submit(tier.fn, query).result(timeout=tier.timeout)
+
+    def _record(self, tier: ResolverTier, started: float, product: Optional[ProductInfo]):
+        with self._lock:
+            tier.record(time.monotonic() - started, product)
+
+    def _record_failure(self, tier: ResolverTier, started: float, timed_out: bool, query: str, error: BaseException):
+        with self._lock:
+            tier.record(time.monotonic() - started, None)
+            if timed_out:
+                tier.timeouts += 1
+            else:
+                tier.errors += 1
+        if timed_out:
+            logger.warning(f"Resolver tier '{tier.name}' timed out after {tier.timeout}s for '{query}'")
+        else:
+            logger.error(f"Resolver tier '{tier.name}' failed for '{query}': {error}")
+
+    def resolve(self, query: str) -> Optional[ProductInfo]:
+        """Первый найденный продукт или None, если ни один уровень не ответил"""
+        for tier in self.tiers:
+            started = time.monotonic()
+            try:
+                if tier.timeout is None:
+                    product = tier.fn(query)
+                else:
+                    product = self._run_with_timeout(tier, query)
+            except FutureTimeout as e:
+                self._record_failure(tier, started, True, query, e)
+                continue
+            except Exception as e:
+                self._record_failure(tier, started, False, query, e)
+                continue
+
+            self._record(tier, started, product)
+            if product is not None:
+                return product
+        return None
+
+    async def resolve_async(self, query: str) -> Optional[ProductInfo]:
+        """Асинхронный вариант resolve: уровни-корутины ожидаются напрямую"""
+        for tier in self.tiers:
+            started = time.monotonic()
+            try:
+                if tier.is_async:
+                    product = await asyncio.wait_for(tier.fn(query), tier.timeout)
+                elif tier.timeout is None:
+                    product = tier.fn(query)
+                else:
+                    product = await asyncio.wait_for(asyncio.to_thread(tier.fn, query), tier.timeout)
+            except asyncio.TimeoutError as e:
+                self._record_failure(tier, started, True, query, e)
+                continue
+            except Exception as e:
+                self._record_failure(tier, started, False, query, e)
+                continue
+
+            self._record(tier, started, product)
+            if product is not None:
+                return product
+        return None
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Попадания и задержки по уровням в порядке цепочки"""
+        with self._lock:
+            return {
+                tier.name: {
+                    'calls': tier.calls,
+                    'hits': tier.hits,
+                    'hit_rate': tier.hits / tier.calls if tier.calls else 0.0,
+                    'timeouts': tier.timeouts,
+                    'errors': tier.errors,
+                    'avg_ms': 1000 * tier.total_seconds / tier.calls if tier.calls else 0.0,
+                    'max_ms': 1000 * tier.max_seconds,
+                }
+                for tier in self.tiers
+            }
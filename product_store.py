@@ -0,0 +1,135 @@
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from barcode_index import MAX_BARCODE_DIGITS
+from models import ProductInfo
+from text_utils import stemmed_words
+
+logger = logging.getLogger(__name__)
+
+
+class LocalProductStore:
+    """
+    Локальное хранилище продуктов, импортированных из дампа Open Food Facts
+
+    SQLite-файл с таблицей продуктов по штрих-коду и полнотекстовым
+    индексом FTS5 по названиям. Заполняется скриптом off_import.py,
+    бот открывает его только на чтение.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path: str) -> 'LocalProductStore':
+        """Создать новое пустое хранилище (для импорта)"""
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                code TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+            USING fts5(name, content='products', content_rowid='rowid')
+        """)
+        return cls(conn)
+
+    @classmethod
+    def open_if_exists(cls, path: Optional[str]) -> Optional['LocalProductStore']:
+        """Открыть готовое хранилище только на чтение или вернуть None"""
+        if not path or not Path(path).exists():
+            return None
+
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("SELECT 1 FROM products LIMIT 1")
+            logger.info(f"Local product store opened: {path}")
+            return cls(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Local product store unavailable: {e}")
+            return None
+
+    def add_many(self, products: Iterable[ProductInfo]) -> int:
+        """Добавить пачку продуктов в одной транзакции"""
+        rows = [
+            (product.barcode, product.name, json.dumps(asdict(product), ensure_ascii=False))
+            for product in products if product.barcode
+        ]
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO products (code, name, payload) VALUES (?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def finalize(self):
+        """Построить полнотекстовый индекс и сжать файл после импорта"""
+        with self._lock:
+            self._conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def get_by_barcode(self, barcode: str) -> Optional[ProductInfo]:
+        """Продукт по штрих-коду"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM products WHERE code = ?", (barcode,)
+            ).fetchone()
+        return ProductInfo.from_dict(json.loads(row[0])) if row else None
+
+    def search(self, query: str, limit: int = 5) -> List[ProductInfo]:
+        """Поиск по названию: все основы слов запроса как префиксы, по релевантности"""
+        words = stemmed_words(query)
+        if not words:
+            return []
+
+        match = ' '.join(f'"{word}"*' for word in words)
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    """
+                    SELECT products.payload FROM products_fts
+                    JOIN products ON products.rowid = products_fts.rowid
+                    WHERE products_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                    """,
+                    (match, limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error searching local product store: {e}")
+            return []
+
+        return [ProductInfo.from_dict(json.loads(row[0])) for row in rows]
+
+    def iter_barcode_records(self) -> Iterator[Tuple[int, bytes]]:
+        """Ключи штрих-кодов (barcode_to_int) и записи продуктов в порядке возрастания ключа"""
+        cursor = self._conn.execute(
+            """
+            SELECT CAST('1' || code AS INTEGER) AS barcode, payload FROM products
+            WHERE code != '' AND code NOT GLOB '*[^0-9]*' AND length(code) <= ?
+            ORDER BY barcode
+            """,
+            (MAX_BARCODE_DIGITS,)
+        )
+        for barcode, payload in cursor:
+            yield barcode, payload.encode('utf-8')
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,358 @@
+import asyncio
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class _Call:
+    """Выполняющийся вызов, результат которого ждут остальные"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов (для потоков)
+
+    Первый вызов с данным ключом выполняет функцию, остальные
+    ждут и получают тот же результат или то же исключение.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """
+    Объединение одинаковых одновременных корутин
+
+    Работа выполняется отдельной задачей, поэтому отмена одного
+    ожидающего не отменяет запрос для остальных.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Помечаем исключение как полученное, даже если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек запросов
+
+    По перцентилям окна вычисляется адаптивный таймаут: пока сервис
+    отвечает быстро, зависший запрос прерывается задолго до верхней
+    границы таймаута.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Перцентиль задержки или None, пока наблюдений мало"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+
+        position = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[position]
+
+    def timeout(self, floor: float, ceiling: float, fraction: float = 0.95,
+                multiplier: float = 2.0) -> float:
+        """Таймаут: перцентиль * множитель в пределах [floor, ceiling]"""
+        observed = self.percentile(fraction)
+        if observed is None:
+            return ceiling
+        return max(floor, min(ceiling, observed * multiplier))
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен: сервис считается недоступным"""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для внешнего сервиса
+
+    closed - запросы идут как обычно; после failure_threshold ошибок
+    подряд автомат размыкается (open) и сразу отклоняет вызовы.
+    Через reset_timeout секунд пропускается один пробный запрос
+    (half_open): успех замыкает автомат, ошибка снова размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def release_probe(self):
+        """Разрешенный allow() вызов не дошел до сервиса: пробный запрос снова свободен"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class RateLimitTimeout(Exception):
+    """Запрос не дождался своей очереди в ограничителе частоты"""
+
+
+class _Ticket:
+    """Место запроса в очереди ограничителя"""
+
+    __slots__ = ('priority', 'seq', 'enqueued_at')
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: '_Ticket') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class PriorityRateLimiter:
+    """
+    Ограничитель частоты запросов (token bucket) с приоритетами
+
+    Корзина вмещает burst токенов и пополняется со скоростью
+    rate_per_second. Ожидающие запросы получают токены строго по
+    очереди: сначала INTERACTIVE (запросы пользователей), затем
+    BACKGROUND (прогрев кэша, фоновое обновление), внутри класса - в
+    порядке поступления. Работает и из потоков (acquire), и из
+    корутин (acquire_async).
+    """
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+    def __init__(self, rate_per_second: float, burst: float = 1):
+        self.rate = rate_per_second
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._queue: List[_Ticket] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+        self.granted = [0, 0]
+        self.timed_out = [0, 0]
+        self.wait_seconds = [0.0, 0.0]
+        self.max_wait_seconds = [0.0, 0.0]
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _enqueue(self, priority: int) -> _Ticket:
+        with self._lock:
+            self._seq += 1
+            ticket = _Ticket(priority, self._seq)
+            bisect.insort(self._queue, ticket)
+            return ticket
+
+    def _try_grant(self, ticket: _Ticket) -> float:
+        """0, если токен выдан, иначе оценка времени до следующей проверки"""
+        now = time.monotonic()
+        self._refill(now)
+        position = self._queue.index(ticket)
+
+        if position == 0 and self._tokens >= 1:
+            self._tokens -= 1
+            self._queue.pop(0)
+            waited = now - ticket.enqueued_at
+            self.granted[ticket.priority] += 1
+            self.wait_seconds[ticket.priority] += waited
+            self.max_wait_seconds[ticket.priority] = max(self.max_wait_seconds[ticket.priority], waited)
+            self._changed.notify_all()
+            return 0
+
+        # Раньше этого запроса токены получат все стоящие впереди
+        return max(0.001, (position + 1 - self._tokens) / self.rate)
+
+    def _give_up(self, ticket: _Ticket):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            self.timed_out[ticket.priority] += 1
+            self._changed.notify_all()
+
+    def try_acquire(self) -> bool:
+        """Взять токен без ожидания, если он свободен и очередь пуста"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._queue or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self, priority: int = INTERACTIVE, timeout: Optional[float] = None):
+        """Дождаться токена (из потока); RateLimitTimeout по истечении timeout"""
+        ticket = self._enqueue(priority)
+        deadline = None if timeout is None else ticket.enqueued_at + timeout
+
+        with self._lock:
+            while True:
+                delay = self._try_grant(ticket)
+                if not delay:
+                    return
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._give_up(ticket)
+                        raise RateLimitTimeout(f"Rate limiter queue wait exceeded {timeout}s")
+                    delay = min(delay, remaining)
+                self._changed.wait(delay)
+
+    async def acquire_async(self, priority: int = INTERACTIVE, timeout: Optional[float] = None):
+        """Дождаться токена (из корутины); RateLimitTimeout по истечении timeout"""
+        ticket = self._enqueue(priority)
+        deadline = None if timeout is None else ticket.enqueued_at + timeout
+
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_grant(ticket)
+                if not delay:
+                    return
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimitTimeout(f"Rate limiter queue wait exceeded {timeout}s")
+                    delay = min(delay, remaining)
+                await asyncio.sleep(delay)
+        finally:
+            with self._lock:
+                self._give_up(ticket)
+
+    def pause(self, seconds: float):
+        """
+        Не выдавать токены ближайшие seconds секунд (ответ 429 от сервиса)
+
+        Корзина уходит в минус: следующий токен появится не раньше, чем
+        через seconds, дальше выдача идет с обычной скоростью.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+            self._changed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очереди и время ожидания по классам приоритета"""
+        with self._lock:
+            depth = [0, 0]
+            for ticket in self._queue:
+                depth[ticket.priority] += 1
+
+            stats = {'tokens': round(self._tokens, 2)}
+            for priority, name in ((self.INTERACTIVE, 'interactive'), (self.BACKGROUND, 'background')):
+                granted = self.granted[priority]
+                stats[name] = {
+                    'queued': depth[priority],
+                    'granted': granted,
+                    'timed_out': self.timed_out[priority],
+                    'avg_wait': self.wait_seconds[priority] / granted if granted else 0.0,
+                    'max_wait': self.max_wait_seconds[priority],
+                }
+            return stats
@@ -0,0 +1,1194 @@
+"""
+Тесты клиента Open Food Facts и кэшей продуктов
+"""
+
+import unittest
+import sys
+import os
+import tempfile
+import asyncio
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+SEARCH_RESPONSE = {
+    'products': [{
+        'code': '4600000000001',
+        'product_name': 'Гречка ядрица',
+        'brands': 'Мистраль',
+        'nutriments': {
+            'energy-kcal_100g': 313,
+            'proteins_100g': 12.6,
+            'fat_100g': 3.3,
+            'carbohydrates_100g': 57.1,
+        },
+    }]
+}
+
+
+class ApiTestCase(unittest.TestCase):
+    """Клиент с постоянным кэшем во временном каталоге"""
+
+    def setUp(self):
+        import config
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for name, filename in [
+            ('OPENFOODFACTS_CACHE_PATH', 'cache.db'),
+            ('OPENFOODFACTS_PRODUCT_STORE_PATH', 'products.db'),
+        ]:
+            patcher = mock.patch.object(config.Config, name, os.path.join(self.tmpdir.name, filename))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    @staticmethod
+    def mock_transport(handler):
+        """httpx-клиент, отвечающий без сети"""
+        import httpx
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestPersistentProductCache(unittest.TestCase):
+    """Тесты постоянного кэша"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_survives_reopen(self):
+        """Тест чтения записей после перезапуска"""
+        from product_cache import PersistentProductCache
+        from models import ProductInfo
+
+        cache = PersistentProductCache(self.path)
+        product = ProductInfo(name='Гречка', calories=92, protein=3.4, fat=0.6, carbs=20)
+        cache.put('search_гречка', [product])
+        cache.put('barcode_404', None)
+        cache.close()
+
+        reopened = PersistentProductCache(self.path)
+        self.assertEqual(reopened.get('search_гречка'), [product])
+        self.assertIsNone(reopened.get('barcode_404'))
+        self.assertEqual(reopened.stats()['hits'], 2)
+
+    def test_expired_entry_is_miss(self):
+        """Тест истечения срока жизни записи"""
+        from product_cache import PersistentProductCache, MISSING
+
+        cache = PersistentProductCache(self.path)
+        cache.put('search_старое', [], ttl_seconds=-1)
+        self.assertIs(cache.get('search_старое'), MISSING)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_missing_directory_disables_cache(self):
+        """Тест отключения кэша без каталога данных"""
+        from product_cache import PersistentProductCache, MISSING
+
+        cache = PersistentProductCache(os.path.join(self.path, 'nope', 'cache.db'))
+        cache.put('search_x', [])
+        self.assertIs(cache.get('search_x'), MISSING)
+
+
+class TestProductCache(unittest.TestCase):
+    """Тесты ограниченного LRU-кэша"""
+
+    def test_lru_eviction_keeps_size_bounded(self):
+        """Тест вытеснения старых записей"""
+        from product_cache import ProductCache, MISSING
+
+        cache = ProductCache(max_entries=4, stripes=1)
+        for i in range(10):
+            cache.put(f'search_{i}', [i])
+        cache.get('search_6')
+        cache.put('search_10', [10])
+
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cache.get('search_6'), [6])
+        self.assertIs(cache.get('search_7'), MISSING)
+        self.assertEqual(cache.stats()['evictions'], 7)
+
+    def test_ttl_by_kind(self):
+        """Тест сроков жизни для разных типов записей"""
+        from product_cache import ProductCache, MISSING
+
+        cache = ProductCache(ttl_seconds={'search': 60, 'barcode': 120, 'negative': -1})
+        self.assertEqual(cache.ttl_for('search_x', ['x']), 60)
+        self.assertEqual(cache.ttl_for('barcode_1', 'x'), 120)
+
+        cache.put('search_пусто', [])
+        cache.put('barcode_0', None)
+        self.assertIs(cache.get('search_пусто'), MISSING)
+        self.assertIs(cache.get('barcode_0'), MISSING)
+
+    def test_stale_entries(self):
+        """Тест выдачи устаревших записей в пределах max_stale_seconds"""
+        from product_cache import ProductCache, MISSING
+
+        cache = ProductCache(ttl_seconds={'search': -1, 'negative': -1}, max_stale_seconds=60)
+        cache.put('search_x', ['x'])
+        cache.put('search_пусто', [])
+
+        self.assertIs(cache.get('search_x'), MISSING)
+        self.assertEqual(cache.get_with_state('search_x'), (['x'], True))
+        self.assertEqual(cache.get_with_state('search_пусто'), (MISSING, False))
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+
+class TestNutrientTable(unittest.TestCase):
+    """Тесты компактного хранения продуктов"""
+
+    def test_round_trip_and_interning(self):
+        """Тест чтения продукта из таблицы и общих строк категорий"""
+        import dataclasses
+        from models import ProductInfo
+        from nutrient_table import NutrientTable
+
+        table = NutrientTable()
+        first = ProductInfo('Гречка', 313, 12.6, 3.3, 62.1, fiber=None, salt=0.012,
+                            barcode='1', brands='Мистраль', categories='Крупы', nova_group=1)
+        second = dataclasses.replace(first, name='Рис', barcode='2', calories=344)
+        table.add('1', first)
+        table.add('2', second)
+
+        self.assertEqual(table.get('1'), first)
+        self.assertEqual(table.get('2').calories, 344)
+        self.assertEqual(len(table.categories), 1)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            first.calories = 0
+
+    def test_ring_buffer(self):
+        """Тест вытеснения самых старых продуктов"""
+        from models import ProductInfo
+        from nutrient_table import NutrientTable
+
+        table = NutrientTable(max_rows=3, initial_capacity=2)
+        for i in range(5):
+            table.add(str(i), ProductInfo(f'п{i}', i, 0, 0, 0))
+
+        self.assertEqual(len(table), 3)
+        self.assertIsNone(table.get('1'))
+        self.assertEqual(table.get('4').calories, 4)
+        self.assertEqual(table.matrix.shape, (3, 8))
+
+
+class TestLocalDatabase(ApiTestCase):
+    """Тесты встроенной локальной базы продуктов"""
+
+    def test_local_database_matrix(self):
+        """Тест локальной базы в виде матрицы float32"""
+        import numpy as np
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        source = api._init_local_database()
+        self.assertEqual(api.local_db.matrix.dtype, np.float32)
+        self.assertEqual(api.local_db.keys(), list(source))
+
+        for name, nutrients in source.items():
+            product = api._local_product(name, 'local_db')
+            for nutrient, value in nutrients.items():
+                self.assertEqual(getattr(product, nutrient), value)
+        self.assertEqual(api.local_db.column('calories')[api.local_db.row_of('яблоко')], 52)
+
+
+class TestAlternatives(ApiTestCase):
+    """Тесты поиска более легких альтернатив"""
+
+    def test_nearest_with_constraints(self):
+        """Тест ближайших соседей с ограничением группы и калорийности"""
+        import numpy as np
+        from models import ProductInfo
+        from nutrient_table import NutrientTable
+
+        table = NutrientTable()
+        table.add('a', ProductInfo('A', 100, 10, 5, 0), 'мясо')
+        table.add('b', ProductInfo('B', 120, 20, 5, 0), 'мясо')
+        table.add('c', ProductInfo('C', 90, 10, 5, 0), 'рыба')
+        table.add('d', ProductInfo('D', 300, 10, 5, 0), 'мясо')
+
+        vector = np.array([200, 10, 5, 0, np.nan, np.nan], dtype=np.float32)
+        scale = np.ones(6, dtype=np.float32)
+        found = table.nearest(vector, scale, k=5, group='мясо', max_calories=140)
+        self.assertEqual([key for _, key in found], ['b', 'a'])
+        self.assertEqual(table.nearest(vector, scale, k=5, group='хлеб'), [])
+
+    def test_lighter_alternatives_from_local_and_cached(self):
+        """Тест альтернатив из локальной базы и полученных из сети продуктов"""
+        from api_client import OpenFoodFactsAPI
+        from models import ProductInfo
+
+        api = OpenFoodFactsAPI()
+        api._remember_products('сыр легкий', [
+            ProductInfo('Сыр легкий', 250, 30, 12, 0, barcode='1'),
+            ProductInfo('Сыр сливочный', 390, 20, 33, 1, barcode='2'),
+        ])
+        cheese = api._local_product('сыр', 'local_db')
+        alternatives = api.find_alternatives(cheese, k=3)
+
+        names = [product.name for product in alternatives]
+        self.assertEqual(names[0], 'Сыр легкий')
+        self.assertNotIn('Сыр сливочный', names)
+        self.assertTrue(all(product.calories <= cheese.calories * 0.7 for product in alternatives))
+        self.assertTrue(all(api._product_group(product) == 'молочный' for product in alternatives))
+
+    def test_no_alternatives_without_category(self):
+        """Тест: продукт без известной категории не получает альтернатив из других групп"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        for name in ('вода', 'кофе', 'яблоко'):
+            product = api._local_product(name, 'local_db')
+            self.assertIsNone(api._product_group(product))
+            self.assertEqual(api.find_alternatives(product), [])
+
+    def test_group_matches_estimation_category(self):
+        """Тест одной категории для альтернатив и оценки при нескольких совпадениях"""
+        from api_client import OpenFoodFactsAPI
+        from models import ProductInfo
+
+        api = OpenFoodFactsAPI()
+        product = ProductInfo('Творог с ягодами', 150, 14, 5, 12)
+        estimated = api._estimate_product_info(product.name)
+
+        self.assertEqual(api._product_group(product), 'молочный')
+        self.assertEqual(estimated.calories, 120)
+
+
+class TestLocalProductIndex(unittest.TestCase):
+    """Тесты индексов локальной базы"""
+
+    def test_matches_linear_scan_order(self):
+        """Тест совпадения с порядком последовательного перебора"""
+        from product_index import LocalProductIndex
+
+        index = LocalProductIndex({
+            'рис': {}, 'орехи': {}, 'грецкий орех': {}, 'масло': {},
+        })
+        # 'рис' стоит в базе раньше, поэтому выигрывает у 'грецкий орех'
+        self.assertEqual(index.find_in_query('грецкий орех и рис'), 'рис')
+        self.assertEqual(index.find_in_query('грецкий орех'), 'грецкий орех')
+        self.assertIsNone(index.find_in_query('кефир'))
+        self.assertEqual(index.find_by_words('орех лесной'), 'грецкий орех')
+        self.assertIsNone(index.find_by_words('ореховый'))
+
+
+class TestFuzzyMatching(ApiTestCase):
+    """Тесты нечеткого поиска"""
+
+    def test_stemmer(self):
+        """Тест стеммера для разных форм слова"""
+        from text_utils import stem_ru
+
+        self.assertEqual(stem_ru('гречки'), stem_ru('гречка'))
+        self.assertEqual(stem_ru('мёд'), 'мед')
+        self.assertEqual(stem_ru('сыр'), 'сыр')
+
+    def test_query_normalization(self):
+        """Тест нормализации запросов и разбора количества"""
+        from text_utils import normalize_query, parse_quantity, query_key
+
+        self.assertEqual(normalize_query('  ГРЕЧКА 200г '), 'гречка')
+        self.assertEqual(normalize_query('овсянка с молоком'), 'овсянка молоком')
+        self.assertEqual(len({query_key(q) for q in ('Гречка', 'гречка ', 'гречки', 'ГРЕЧКА 200г')}), 1)
+        self.assertEqual(parse_quantity('1,5 кг яблок'), (1500.0, 'яблок'))
+        self.assertEqual(parse_quantity('200 гр. молока на завтрак'), (200.0, 'молока на завтрак'))
+        self.assertEqual(parse_quantity('яблоко'), (100.0, 'яблоко'))
+
+    def test_query_normalization_keeps_percentages(self):
+        """Тест разных ключей кэша для продуктов разной жирности"""
+        from text_utils import normalize_query, parse_quantity, query_key
+
+        self.assertEqual(normalize_query('Молоко 3,2 %'), 'молоко 3.2%')
+        self.assertEqual(query_key('молоко 3,2%'), query_key('молоко 3.2% 200 мл'))
+        self.assertNotEqual(query_key('молоко 3,2%'), query_key('молоко 1,5%'))
+        self.assertEqual(parse_quantity('молоко 3,2% 200 мл'), (200.0, 'молоко 3,2%'))
+
+    def test_query_variants_share_cache_entry(self):
+        """Тест одного запроса в сеть для разных форм названия"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+        with mock.patch.object(api.session, 'get', return_value=response) as get:
+            api.search_product('Гречка')
+            results = api.search_product('ГРЕЧКИ 200г')
+
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(get.call_args.kwargs['params']['search_terms'], 'гречка')
+        self.assertEqual(results[0].name, 'Гречка ядрица')
+
+    def test_keyword_matcher(self):
+        """Тест поиска ключевых слов за один проход"""
+        from text_utils import KeywordMatcher
+
+        matcher = KeywordMatcher({'a': ['he', 'she'], 'b': ['his', 'hers'], 'c': ['сок']})
+        found = sorted((start, keyword) for start, keyword, _ in matcher.find_all('uSHErs'))
+        self.assertEqual(found, [(1, 'she'), (2, 'he'), (2, 'hers')])
+        self.assertEqual(matcher.first_label('she hers'), 'a')
+        self.assertEqual(matcher.last_label('she hers'), 'b')
+        self.assertIsNone(matcher.first_label('нет совпадений'))
+
+    def test_estimate_category_order(self):
+        """Тест оценки категории: побеждает последняя подходящая категория"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        self.assertEqual(api._estimate_product_info('вишневый сок').calories, 30)
+        self.assertEqual(api._estimate_product_info('неведомое').calories, 35)
+
+    def test_trigram_index_bounded(self):
+        """Тест поиска и вытеснения в триграммном индексе"""
+        from product_index import TrigramIndex
+
+        index = TrigramIndex(max_entries=2)
+        index.add('Куриная грудка', 'грудка')
+        index.add('гречка', 'гречка')
+        self.assertEqual(index.search('курииная грудка', 0.75)[0], 'грудка')
+
+        index.add('молоко', 'молоко')
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.search('куриная грудка', 0.75))
+
+    def test_trigram_index_expires_entries(self):
+        """Тест: похожие запросы не отдаются после срока жизни результатов поиска"""
+        import time
+        from product_index import TrigramIndex
+
+        index = TrigramIndex(max_age_seconds=60)
+        index.add('гречка', 'гречка')
+        self.assertEqual(index.search('гречки', 0.75)[0], 'гречка')
+
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(index.search('гречки', 0.75))
+        self.assertEqual(len(index), 0)
+
+    def test_misspelled_query_served_without_network(self):
+        """Тест ответа на запрос с опечаткой без обращения к сети"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+        with mock.patch.object(api.session, 'get', return_value=response) as get:
+            api.search_product('гречка')
+            product = api.get_product_info('гречки')
+
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(product.name, 'Гречка ядрица')
+
+    def test_fuzzy_match_requires_same_percentages(self):
+        """Тест: похожий запрос с другой жирностью не отдается из нечеткого индекса"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'products': [{
+            'code': '4600000000002',
+            'product_name': 'Молоко 3,5%',
+            'nutriments': {'energy-kcal_100g': 61, 'proteins_100g': 3, 'fat_100g': 3.5, 'carbohydrates_100g': 4.7},
+        }]}
+        with mock.patch.object(api.session, 'get', return_value=response):
+            api.search_product('молоко 3,5%')
+
+        self.assertIsNone(api._resolve_cached_fuzzy('молоко 2,5%'))
+        self.assertEqual(api._resolve_cached_fuzzy('молоко 3.5 %').name, 'Молоко 3,5%')
+
+    def test_local_fuzzy_fallback(self):
+        """Тест нечеткого совпадения с локальной базой"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        product = api._lookup_local_db('гречку')
+        self.assertEqual(product.name, 'Гречка')
+        self.assertEqual(product.source, 'local_db_fuzzy')
+
+
+class TestOpenFoodFactsAPI(ApiTestCase):
+    """Тесты синхронного клиента"""
+
+    def test_local_db_fallback(self):
+        """Тест поиска в локальной базе при недоступности сети"""
+        import requests
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        with mock.patch.object(api.session, 'get', side_effect=requests.exceptions.ConnectionError):
+            product = api.get_product_info('зеленое яблоко')
+
+        self.assertEqual(product.name, 'Яблоко')
+        self.assertEqual(product.source, 'local_db')
+
+    def test_search_is_cached(self):
+        """Тест повторного поиска из кэша"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+        with mock.patch.object(api.session, 'get', return_value=response) as get:
+            first = api.search_product('гречка')
+            second = api.search_product('гречка')
+
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first[0].name, 'Гречка ядрица')
+
+
+    def test_stale_search_revalidated_in_background(self):
+        """Тест stale-while-revalidate: устаревший результат сразу, обновление в фоне"""
+        from api_client import OpenFoodFactsAPI
+        from product_cache import ProductCache
+
+        api = OpenFoodFactsAPI()
+        api.cache = ProductCache(ttl_seconds={'search': -1}, max_stale_seconds=60)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+        with mock.patch.object(api.session, 'get', return_value=response) as get:
+            api.search_product('гречка')
+            stale = api.search_product('гречка')
+            api._refresh_executor.shutdown(wait=True)
+
+        self.assertEqual(stale[0].name, 'Гречка ядрица')
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(api.revalidations, 1)
+
+    def test_persistent_entries_follow_memory_ttl(self):
+        """Тест: запись с диска подчиняется тем же срокам свежести, что и в памяти"""
+        import time
+        from api_client import OpenFoodFactsAPI
+        from models import ProductInfo
+        from product_cache import MISSING, ProductCache
+
+        api = OpenFoodFactsAPI()
+        api.cache = ProductCache(ttl_seconds={'search': 3600}, max_stale_seconds=7200)
+        product = ProductInfo(name='Гречка', calories=92, protein=3.4, fat=0.6, carbs=20)
+        for key, age in (('search_свежая', 60), ('search_устаревшая', 5000), ('search_старая', 20000)):
+            with mock.patch('time.time', return_value=time.time() - age):
+                api.persistent_cache.put(key, [product])
+
+        refresh = mock.Mock()
+        with mock.patch.object(api, '_schedule_refresh') as schedule:
+            self.assertEqual(api._cache_get('search_свежая', refresh), [product])
+            self.assertEqual(api._cache_get('search_устаревшая', refresh), [product])
+            self.assertIs(api._cache_get('search_старая', refresh), MISSING)
+
+        schedule.assert_called_once_with('search_устаревшая', refresh)
+        self.assertEqual(api.cache.get_with_state('search_устаревшая'), ([product], True))
+
+
+    def test_requests_project_parsed_fields(self):
+        """Тест запроса только нужных парсеру полей"""
+        from api_client import OpenFoodFactsAPI, PRODUCT_FIELDS
+
+        api = OpenFoodFactsAPI()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'status': 1, 'product': {
+            'code': '42', 'product_name': 'Кефир', 'nova_group': 1,
+            'nutriments': {'energy-kcal_100g': 40, 'proteins_100g': 3, 'fat_100g': 1,
+                           'carbohydrates_100g': 4},
+        }}
+        with mock.patch.object(api.session, 'get', return_value=response) as get:
+            product = api.get_product_by_barcode('42')
+
+        self.assertEqual(get.call_args.kwargs['params'], {'fields': PRODUCT_FIELDS})
+        self.assertEqual(api._search_request('кефир', 3)[1]['fields'], PRODUCT_FIELDS)
+        self.assertEqual(product.nova_group, 1)
+
+    def test_serving_size_does_not_scale_nutrients(self):
+        """Тест: пищевая ценность OFF - на 100 г, независимо от размера порции"""
+        from api_client import OpenFoodFactsAPI
+
+        product = OpenFoodFactsAPI._parse_product_data({
+            'code': '43', 'product_name': 'Батончик', 'serving_size': '30 g',
+            'nutriments': {'energy-kcal_100g': 400, 'proteins_100g': 10, 'fat_100g': 20,
+                           'carbohydrates_100g': 50},
+        })
+
+        self.assertEqual(product.serving_size_g, 100)
+        self.assertEqual(OpenFoodFactsAPI._scale_ingredient(product, 30)['calories'], 120)
+
+    def test_warm_up(self):
+        """Тест прогрева кэша популярными запросами"""
+        import requests
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        api.cache.put('search_рис', [])
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+
+        def fake_get(url, params=None, **kwargs):
+            if params['search_terms'] == 'торт':
+                raise requests.exceptions.ConnectionError('boom')
+            return response
+
+        with mock.patch.object(api.session, 'get', side_effect=fake_get) as get:
+            stats = api.warm_up(['гречка', 'Гречка ', 'рис', 'торт', ''])
+            api.search_product('гречка')
+
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual((stats['queries'], stats['cached'], stats['fetched'], stats['failed']), (3, 1, 1, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+        self.assertEqual(api.search_limiter.stats()['background']['granted'], 2)
+
+    def test_ping_bypasses_local_tiers(self):
+        """Тест проверки сервиса прямым запросом, без кэша и локальной базы"""
+        import requests
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = {'status': 1, 'product': {'product_name': 'Nutella'}}
+        down = mock.Mock(status_code=503)
+        down.raise_for_status.side_effect = requests.exceptions.HTTPError('503')
+
+        with mock.patch.object(api.session, 'get', side_effect=[ok, down]) as get:
+            self.assertEqual(api.ping(), 'Nutella')
+            with self.assertRaises(requests.exceptions.HTTPError):
+                api.ping()
+        self.assertEqual(get.call_count, 2)
+
+    def test_warm_up_survives_errors_and_shares_cache(self):
+        """Тест прогрева общего кэша при ошибке разбора одного запроса"""
+        from api_client import AsyncOpenFoodFactsAPI, OpenFoodFactsAPI
+
+        bot_api = AsyncOpenFoodFactsAPI()
+        warmer = OpenFoodFactsAPI()
+        warmer.share_state(bot_api)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = SEARCH_RESPONSE
+        broken = mock.Mock(status_code=200)
+        broken.json.side_effect = KeyError('products')
+
+        def fake_get(url, params=None, **kwargs):
+            return broken if params['search_terms'] == 'торт' else response
+
+        with mock.patch.object(warmer.session, 'get', side_effect=fake_get):
+            stats = warmer.warm_up(['торт', 'гречка'])
+
+        self.assertEqual((stats['fetched'], stats['failed']), (1, 1))
+        self.assertIsNotNone(bot_api.cache.get('search_гречка'))
+        self.assertIs(warmer.search_limiter, bot_api.search_limiter)
+        self.assertIs(warmer.product_limiter, bot_api.product_limiter)
+        self.assertIs(warmer.breaker, bot_api.breaker)
+        self.assertEqual(bot_api.search_limiter.stats()['background']['granted'], 2)
+
+
+class TestSingleFlight(ApiTestCase):
+    """Тесты объединения одинаковых запросов"""
+
+    def test_concurrent_threads_share_one_request(self):
+        """Тест одного запроса для одновременных потоков"""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        started = threading.Event()
+
+        def slow_get(*args, **kwargs):
+            started.set()
+            time.sleep(0.2)
+            response = mock.Mock(status_code=200)
+            response.json.return_value = SEARCH_RESPONSE
+            return response
+
+        with mock.patch.object(api.session, 'get', side_effect=slow_get) as get:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: api.search_product('гречка'), range(8)))
+
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(all(r == results[0] for r in results))
+
+    def test_concurrent_coroutines_share_one_request(self):
+        """Тест одного запроса для одновременных корутин"""
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        calls = []
+
+        def handler(request):
+            calls.append(request.url)
+            return httpx.Response(200, json=SEARCH_RESPONSE)
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api._client = self.mock_transport(handler)
+            results = await asyncio.gather(*(api.search_product('гречка') for _ in range(20)))
+            await api.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[-1][0].name, 'Гречка ядрица')
+
+
+class TestOffImport(ApiTestCase):
+    """Тесты импорта дампа Open Food Facts"""
+
+    def write_dump(self, filename, content):
+        path = os.path.join(self.tmpdir.name, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_jsonl_import_and_lookup(self):
+        """Тест импорта JSONL и поиска без сети"""
+        import json
+        from off_import import import_dump
+        from api_client import OpenFoodFactsAPI
+
+        lines = [json.dumps(product, ensure_ascii=False) for product in SEARCH_RESPONSE['products']]
+        lines.append('{broken')
+        lines.append(json.dumps({'code': '1', 'product_name': 'Пусто', 'nutriments': {}}))
+        dump = self.write_dump('dump.jsonl', '\n'.join(lines))
+
+        import config
+        stats = import_dump(dump, config.Config.OPENFOODFACTS_PRODUCT_STORE_PATH)
+        self.assertEqual(stats, {'read': 3, 'imported': 1, 'skipped': 2})
+
+        api = OpenFoodFactsAPI()
+        with mock.patch.object(api.session, 'get') as get:
+            products = api.search_product('гречки')
+            product = api.get_product_by_barcode('4600000000001')
+
+        get.assert_not_called()
+        self.assertEqual(products[0].name, 'Гречка ядрица')
+        self.assertEqual(product.brands, 'Мистраль')
+
+    def test_csv_import(self):
+        """Тест импорта CSV-дампа"""
+        from off_import import import_dump
+        from product_store import LocalProductStore
+
+        dump = self.write_dump('dump.csv', (
+            'code\tproduct_name\tbrands\tenergy-kcal_100g\tproteins_100g\tfat_100g\tcarbohydrates_100g\n'
+            '4601\tКефир 2,5%\tПростоквашино\t53\t2.9\t2.5\t4\n'
+            '4602\tВода\t\t\t\t\t\n'
+        ))
+        output = os.path.join(self.tmpdir.name, 'csv.db')
+        stats = import_dump(dump, output)
+        self.assertEqual(stats['imported'], 1)
+
+        store = LocalProductStore.open_if_exists(output)
+        self.assertEqual(store.search('кефир')[0].calories, 53)
+        self.assertIsNone(store.get_by_barcode('4602'))
+
+
+class TestBarcodeIndex(ApiTestCase):
+    """Тесты mmap-индекса штрих-кодов"""
+
+    def test_binary_search(self):
+        """Тест поиска по отсортированному индексу"""
+        import json
+        from barcode_index import BarcodeIndex, barcode_to_int
+
+        base = os.path.join(self.tmpdir.name, 'barcodes')
+        records = [
+            (barcode_to_int(str(code)), json.dumps({'name': f'P{code}', 'calories': code % 500, 'protein': 1,
+                                                    'fat': 1, 'carbs': 1, 'barcode': str(code)}).encode())
+            for code in range(4600000000000, 4600000010000, 7)
+        ]
+        self.assertEqual(BarcodeIndex.build(base, records), len(records))
+
+        index = BarcodeIndex.open_if_exists(base)
+        self.assertEqual(index.get('4600000000007').name, 'P4600000000007')
+        self.assertEqual(index.get('4600000009996').barcode, '4600000009996')
+        self.assertIsNone(index.get('4600000000008'))
+        self.assertIsNone(index.get('abc'))
+        index.close()
+
+    def test_leading_zeros_and_mismatched_files(self):
+        """Тест: коды с ведущими нулями различаются, несогласованные файлы не открываются"""
+        import json
+        from barcode_index import BarcodeIndex, barcode_to_int
+
+        def record(code):
+            return barcode_to_int(code), json.dumps({'name': f'P{code}', 'calories': 1, 'protein': 1,
+                                                     'fat': 1, 'carbs': 1, 'barcode': code}).encode()
+
+        base = os.path.join(self.tmpdir.name, 'barcodes')
+        records = sorted([record('12345'), record('0012345'), record('012345')])
+        self.assertEqual(BarcodeIndex.build(base, records), 3)
+
+        index = BarcodeIndex.open_if_exists(base)
+        for code in ('12345', '0012345', '012345'):
+            self.assertEqual(index.get(code).barcode, code)
+        self.assertIsNone(index.get('00012345'))
+        index.close()
+
+        with open(f"{base}.dat", 'ab') as f:
+            f.write(b'{}')
+        self.assertIsNone(BarcodeIndex.open_if_exists(base))
+
+    def test_import_builds_index(self):
+        """Тест построения индекса при импорте дампа"""
+        import json
+        import config
+        from off_import import import_dump
+        from api_client import OpenFoodFactsAPI
+
+        dump = os.path.join(self.tmpdir.name, 'dump.jsonl')
+        with open(dump, 'w', encoding='utf-8') as f:
+            for product in SEARCH_RESPONSE['products']:
+                f.write(json.dumps(product, ensure_ascii=False) + '\n')
+
+        with mock.patch.object(config.Config, 'OPENFOODFACTS_BARCODE_INDEX_PATH',
+                               os.path.join(self.tmpdir.name, 'barcodes')):
+            stats = import_dump(dump, os.path.join(self.tmpdir.name, 'other.db'),
+                                barcode_index_path=config.Config.OPENFOODFACTS_BARCODE_INDEX_PATH)
+            api = OpenFoodFactsAPI()
+
+        self.assertEqual(stats['barcodes'], 1)
+        self.assertIsNone(api.product_store)
+        with mock.patch.object(api.session, 'get') as get:
+            product = api.get_product_by_barcode('4600000000001')
+        get.assert_not_called()
+        self.assertEqual(product.name, 'Гречка ядрица')
+
+
+class TestBarcodeBatch(ApiTestCase):
+    """Тесты пакетного поиска по штрих-кодам"""
+
+    PRODUCT = {'status': 1, 'product': SEARCH_RESPONSE['products'][0]}
+
+    def test_batch_preserves_order_and_status(self):
+        """Тест порядка результатов и статусов"""
+        import requests
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        api.cache.put('barcode_111', None)
+
+        def fake_get(url, **kwargs):
+            if '/500.json' in url:
+                raise requests.exceptions.ConnectionError('boom')
+            response = mock.Mock(status_code=404 if '/404.json' in url else 200)
+            response.json.return_value = self.PRODUCT
+            return response
+
+        with mock.patch.object(api.session, 'get', side_effect=fake_get) as get:
+            results = api.get_products_by_barcodes(['4600000000001', '111', '404', '500', '4600000000001'])
+
+        self.assertEqual([r.status for r in results], ['found', 'not_found', 'not_found', 'error', 'found'])
+        self.assertEqual(results[0].product.name, 'Гречка ядрица')
+        self.assertEqual(get.call_count, 3)
+
+        again = api.get_products_by_barcodes(['4600000000001'])
+        self.assertEqual(again[0].status, 'cached')
+
+    def test_async_batch_bounded_concurrency(self):
+        """Тест ограничения параллельных запросов"""
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        state = {'active': 0, 'peak': 0}
+
+        async def handler(request):
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await asyncio.sleep(0.01)
+            state['active'] -= 1
+            return httpx.Response(200, json=self.PRODUCT)
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api._client = self.mock_transport(handler)
+            api.product_limiter.burst = api.product_limiter._tokens = 12
+            results = await api.get_products_by_barcodes([str(i) for i in range(12)], max_concurrency=3)
+            await api.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual([r.barcode for r in results], [str(i) for i in range(12)])
+        self.assertTrue(all(r.status == 'found' for r in results))
+        self.assertLessEqual(state['peak'], 3)
+
+    def test_async_batch_non_json_body_is_item_error(self):
+        """Тест: ответ 200 не в формате JSON дает ошибку только для своего штрих-кода"""
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        def handler(request):
+            if request.url.path.endswith('/2.json'):
+                return httpx.Response(200, text='<html>Bad gateway</html>')
+            return httpx.Response(200, json=self.PRODUCT)
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api._client = self.mock_transport(handler)
+            results = await api.get_products_by_barcodes(['1', '2'])
+            await api.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual([r.status for r in results], ['found', 'error'])
+
+
+class TestAnalyzeMeal(ApiTestCase):
+    """Тесты анализа приема пищи"""
+
+    def test_duplicates_resolved_once_in_parallel(self):
+        """Тест параллельного поиска уникальных ингредиентов"""
+        import time
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        calls = []
+
+        def slow_info(query):
+            calls.append(query)
+            time.sleep(0.2)
+            return api._estimate_product_info(query)
+
+        with mock.patch.object(api, 'get_product_info', side_effect=slow_info):
+            started = time.monotonic()
+            result = api.analyze_meal('200г гречки 100г курицы 50г гречки')
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(result['success'])
+        self.assertEqual(len(result['total']['ingredients']), 3)
+        self.assertEqual(sorted(calls), ['гречки', 'курицы'])
+        self.assertLess(elapsed, 0.35)
+
+    def test_batch_matches_single_analysis(self):
+        """Тест пакетного анализа: те же итоги, ингредиенты ищутся один раз"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        descriptions = ['200г гречки 100г курицы', '1 кг яблок', '150г гречки 250мл молока', '']
+        with mock.patch.object(api, 'get_product_info', side_effect=api._estimate_product_info) as info:
+            batch = api.analyze_meals(descriptions)
+            self.assertEqual(info.call_count, 4)
+            singles = [api.analyze_meal(description) for description in descriptions]
+
+        for result, single in zip(batch, singles):
+            self.assertEqual(result['success'], single['success'])
+            self.assertEqual(len(result['total']['ingredients']), len(single['total']['ingredients']))
+            for nutrient in ('calories', 'protein', 'fat', 'carbs'):
+                self.assertAlmostEqual(result['total'][nutrient], single['total'][nutrient])
+        self.assertAlmostEqual(batch[1]['total']['calories'], 350)
+        self.assertFalse(batch[3]['success'])
+
+    def test_deadline_returns_partial_result(self):
+        """Тест частичного результата по истечении срока"""
+        from api_client import AsyncOpenFoodFactsAPI
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+
+            async def info(query):
+                if query == 'курицы':
+                    await asyncio.sleep(5)
+                return api._estimate_product_info(query)
+
+            api.get_product_info = info
+            return await api.analyze_meal('200г гречки 100г курицы', deadline=0.1)
+
+        result = asyncio.run(run())
+        self.assertTrue(result['success'])
+        self.assertEqual([i['name'] for i in result['total']['ingredients']], ['гречки'])
+        self.assertEqual(result['unresolved'], ['курицы'])
+
+
+class TestResilience(ApiTestCase):
+    """Тесты адаптивных таймаутов, автомата защиты и хеджирования"""
+
+    def test_adaptive_timeout(self):
+        """Тест таймаута по перцентилю задержек"""
+        from resilience import LatencyTracker
+
+        tracker = LatencyTracker(min_samples=10)
+        self.assertEqual(tracker.timeout(1, 10), 10)
+        for _ in range(100):
+            tracker.record(0.3)
+        self.assertAlmostEqual(tracker.timeout(1, 10), 1)
+        for _ in range(100):
+            tracker.record(2.0)
+        self.assertAlmostEqual(tracker.timeout(1, 10), 4.0)
+
+    def test_rate_limiter_priorities(self):
+        """Тест очереди ограничителя: пользовательские запросы раньше фоновых"""
+        import threading
+        import time
+        from resilience import PriorityRateLimiter
+
+        limiter = PriorityRateLimiter(rate_per_second=10, burst=1)
+        limiter.acquire()
+        order = []
+
+        def take(priority, name):
+            limiter.acquire(priority)
+            order.append(name)
+
+        background = threading.Thread(target=take, args=(limiter.BACKGROUND, 'background'))
+        background.start()
+        time.sleep(0.01)
+        interactive = threading.Thread(target=take, args=(limiter.INTERACTIVE, 'interactive'))
+        interactive.start()
+        background.join()
+        interactive.join()
+
+        self.assertEqual(order, ['interactive', 'background'])
+        stats = limiter.stats()
+        self.assertEqual(stats['background']['granted'], 1)
+        self.assertGreater(stats['background']['max_wait'], 0)
+
+    def test_rate_limiter_timeout(self):
+        """Тест отказа, если очередь не дошла до запроса вовремя"""
+        from resilience import PriorityRateLimiter, RateLimitTimeout
+
+        limiter = PriorityRateLimiter(rate_per_second=0.1, burst=1)
+        self.assertTrue(limiter.try_acquire())
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(timeout=0.05)
+        with self.assertRaises(RateLimitTimeout):
+            asyncio.run(limiter.acquire_async(timeout=0.05))
+
+        stats = limiter.stats()
+        self.assertEqual(stats['interactive']['timed_out'], 2)
+        self.assertEqual(stats['interactive']['queued'], 0)
+
+    def test_circuit_breaker_cycle(self):
+        """Тест размыкания и пробного запроса"""
+        from resilience import CircuitBreaker
+
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        import time
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit_timeout_releases_probe(self):
+        """Тест: отказ ограничителя во время пробного запроса не блокирует автомат"""
+        import time
+        from api_client import OpenFoodFactsAPI
+        from resilience import CircuitBreaker, PriorityRateLimiter, RateLimitTimeout
+
+        api = OpenFoodFactsAPI()
+        api.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        api.breaker.record_failure()
+        time.sleep(0.02)
+
+        limiter = PriorityRateLimiter(rate_per_second=0.1, burst=1)
+        limiter.try_acquire()
+        with mock.patch('config.Config.OPENFOODFACTS_RATE_LIMIT_MAX_WAIT', 0.01):
+            with self.assertRaises(RateLimitTimeout):
+                api._http_get('https://example.org', limiter=limiter)
+
+        self.assertEqual(api.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(api.breaker.allow())
+
+    def test_throttled_response_pauses_limiter(self):
+        """Тест: ответ 429 не замыкает автомат и приостанавливает выдачу токенов"""
+        import time
+        from api_client import OpenFoodFactsAPI
+        from resilience import CircuitBreaker, PriorityRateLimiter, RateLimitTimeout
+
+        api = OpenFoodFactsAPI()
+        api.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        api.breaker.record_failure()
+        time.sleep(0.02)
+
+        limiter = PriorityRateLimiter(rate_per_second=100, burst=5)
+        response = mock.Mock(status_code=429, headers={'Retry-After': '30'})
+        with mock.patch.object(api.session, 'get', return_value=response):
+            api._http_get('https://example.org', limiter=limiter)
+
+        self.assertEqual(api.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(api.breaker.allow())
+        self.assertIsNone(api.latency.percentile(0.5))
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(timeout=0.05)
+        self.assertEqual(api._retry_after('bogus'), 1.0)
+        with mock.patch('config.Config.OPENFOODFACTS_RETRY_AFTER_MAX', 60):
+            self.assertEqual(api._retry_after('3600'), 60)
+
+    def test_open_circuit_short_circuits_to_local(self):
+        """Тест обхода сети при разомкнутом автомате"""
+        import requests
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        with mock.patch.object(api.session, 'get', side_effect=requests.exceptions.Timeout) as get:
+            for query in ['один', 'два', 'три', 'четыре', 'пять', 'шесть']:
+                api.search_product(query)
+            self.assertEqual(get.call_count, 5)
+
+            product = api.get_product_info('спелый банан')
+
+        self.assertEqual(get.call_count, 5)
+        self.assertEqual(product.source, 'local_db')
+        self.assertEqual(api._barcode_online('123').status, 'error')
+
+    def test_hedged_request_wins(self):
+        """Тест второго запроса при медленном первом"""
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        calls = []
+
+        async def handler(request):
+            calls.append(request.url)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return httpx.Response(200, json=SEARCH_RESPONSE)
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api.hedge_requests = True
+            for _ in range(50):
+                api.latency.record(0.02)
+            api._client = self.mock_transport(handler)
+            products = await api.search_product('гречка')
+            await api.aclose()
+            return api, products
+
+        import time
+        started = time.monotonic()
+        api, products = asyncio.run(run())
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(api.hedged, 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(products[0].name, 'Гречка ядрица')
+
+
+class TestProductResolver(ApiTestCase):
+    """Тесты цепочки источников get_product_info"""
+
+    def test_local_staple_served_before_network(self):
+        """Тест ответа локальной базы без обращения к сети"""
+        from api_client import OpenFoodFactsAPI
+
+        api = OpenFoodFactsAPI()
+        with mock.patch.object(api.session, 'get') as get:
+            product = api.get_product_info('Яблоки')
+
+        get.assert_not_called()
+        self.assertEqual(product.name, 'Яблоко')
+        stats = api.resolver.stats()
+        self.assertEqual(stats['local']['hits'], 1)
+        self.assertEqual(stats['openfoodfacts']['calls'], 0)
+        self.assertEqual(list(stats)[:2], ['cache', 'fuzzy'])
+
+    def test_tier_timeout_falls_through(self):
+        """Тест перехода к следующему уровню по таймауту и при ошибке"""
+        import time
+        from product_resolver import ResolverChain, ResolverTier, parse_chain, parse_timeouts
+
+        def slow(query):
+            time.sleep(0.5)
+            return 'slow'
+
+        def broken(query):
+            raise ValueError(query)
+
+        chain = ResolverChain([
+            ResolverTier('slow', slow, timeout=0.05),
+            ResolverTier('broken', broken),
+            ResolverTier('fast', lambda query: query.upper()),
+            ResolverTier('never', lambda query: 'never'),
+        ])
+
+        started = time.monotonic()
+        self.assertEqual(chain.resolve('x'), 'X')
+        self.assertLess(time.monotonic() - started, 0.4)
+
+        stats = chain.stats()
+        self.assertEqual(stats['slow']['timeouts'], 1)
+        self.assertEqual(stats['broken']['errors'], 1)
+        self.assertEqual(stats['fast']['hit_rate'], 1.0)
+        self.assertEqual(stats['never']['calls'], 0)
+
+        self.assertEqual(parse_chain(' cache, local ,'), ['cache', 'local'])
+        self.assertEqual(parse_timeouts('store:0.5,openfoodfacts:8'), {'store': 0.5, 'openfoodfacts': 8.0})
+
+    def test_async_tier_timeout(self):
+        """Тест таймаута уровня-корутины"""
+        from product_resolver import ResolverChain, ResolverTier
+
+        async def slow(query):
+            await asyncio.sleep(1)
+            return 'slow'
+
+        chain = ResolverChain([
+            ResolverTier('slow', slow, timeout=0.05),
+            ResolverTier('local', lambda query: 'local'),
+        ])
+        self.assertEqual(asyncio.run(chain.resolve_async('x')), 'local')
+        self.assertEqual(chain.stats()['slow']['timeouts'], 1)
+
+
+class TestAsyncOpenFoodFactsAPI(ApiTestCase):
+    """Тесты асинхронного клиента"""
+
+    def test_search_and_barcode(self):
+        """Тест поиска и запроса по штрих-коду через пул соединений"""
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        def handler(request):
+            if request.url.path.endswith('/search.pl'):
+                return httpx.Response(200, json=SEARCH_RESPONSE)
+            return httpx.Response(404)
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api._client = self.mock_transport(handler)
+            products = await api.search_product('гречка')
+            missing = await api.get_product_by_barcode('0000')
+            info = await api.get_product_info('гречка')
+            await api.aclose()
+            return products, missing, info
+
+        products, missing, info = asyncio.run(run())
+        self.assertEqual(products[0].calories, 313)
+        self.assertIsNone(missing)
+        self.assertEqual(info.name, 'Гречка ядрица')
+
+    def test_sqlite_cache_off_event_loop(self):
+        """Тест: постоянный кэш читается и пишется вне потока event loop"""
+        import threading
+        import httpx
+        from api_client import AsyncOpenFoodFactsAPI
+
+        threads = []
+
+        def record(method):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return method(*args, **kwargs)
+            return wrapper
+
+        async def run():
+            api = AsyncOpenFoodFactsAPI()
+            api.persistent_cache.get_with_age = record(api.persistent_cache.get_with_age)
+            api.persistent_cache.put = record(api.persistent_cache.put)
+            api._client = self.mock_transport(lambda request: httpx.Response(200, json=SEARCH_RESPONSE))
+            await api.search_product('гречка')
+            await api.aclose()
+            api._disk_writer.shutdown(wait=True)
+            return api
+
+        api = asyncio.run(run())
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(api.persistent_cache.get('search_гречк')[0].name, 'Гречка ядрица')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -59,5 +59,151 @@ class TestUtils(unittest.TestCase):
         self.assertIn('fat', macros)
         self.assertIn('carbs', macros)
 
+class TestIdAllocator(unittest.TestCase):
+    """Тесты генератора идентификаторов"""
+    
+    def test_unique_across_threads(self):
+        """Тест уникальности и роста идентификаторов из нескольких потоков"""
+        import threading
+        from id_allocator import SnowflakeIdGenerator, SEQUENCE_BITS, MAX_WORKER_ID
+        
+        generator = SnowflakeIdGenerator(worker_id=7)
+        batches = [[] for _ in range(4)]
+        
+        def take(batch):
+            for _ in range(5000):
+                batch.append(generator.next_id())
+        
+        threads = [threading.Thread(target=take, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        ids = [new_id for batch in batches for new_id in batch]
+        self.assertEqual(len(set(ids)), len(ids))
+        for batch in batches:
+            self.assertEqual(batch, sorted(batch))
+        self.assertTrue(all(0 < new_id < 2 ** 63 for new_id in ids))
+        self.assertEqual((ids[0] >> SEQUENCE_BITS) & MAX_WORKER_ID, 7)
+    
+    def test_clock_moving_backwards(self):
+        """Тест отсутствия повторов при отставании часов"""
+        from unittest import mock
+        from id_allocator import SnowflakeIdGenerator
+        
+        generator = SnowflakeIdGenerator(worker_id=1)
+        with mock.patch.object(generator, '_now_ms', side_effect=[1000, 1000, 900, 1001]):
+            ids = [generator.next_id() for _ in range(4)]
+        self.assertEqual(ids, sorted(set(ids)))
+        
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(worker_id=1024)
+
+class TestPreparedQueryCache(unittest.TestCase):
+    """Тесты кэша подготовленных запросов YDB"""
+    
+    def test_reuse_and_invalidation(self):
+        """Тест повторного использования и сброса при пересоздании сессии"""
+        from unittest import mock
+        from ydb_client import PreparedQueryCache
+        
+        class FakeSession:
+            session_id = 'a'
+            prepare = mock.Mock(side_effect=lambda query: ('prepared', query))
+        
+        cache = PreparedQueryCache()
+        session = FakeSession()
+        for _ in range(3):
+            self.assertEqual(cache.prepare(session, 'SELECT 1'), ('prepared', 'SELECT 1'))
+        self.assertEqual(session.prepare.call_count, 1)
+        
+        session.session_id = 'b'
+        cache.prepare(session, 'SELECT 1')
+        cache.invalidate(session)
+        cache.prepare(session, 'SELECT 1')
+        
+        stats = cache.stats()
+        self.assertEqual(session.prepare.call_count, 3)
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (2, 3, 2))
+        
+        del session
+        import gc
+        gc.collect()
+        self.assertEqual(cache.stats()['sessions'], 0)
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    """Тесты пакетной вставки строк"""
+    
+    COLUMNS = (('id', 'Uint64'), ('user_id', 'Uint64'), ('amount', 'Float'))
+    
+    def test_rows_batched_into_one_upsert(self):
+        """Тест записи одновременных вставок одним запросом"""
+        import asyncio
+        from unittest import mock
+        import database
+        
+        async def run():
+            buffer = database.WriteBehindBuffer('water_intake', self.COLUMNS, max_rows=3, delay_seconds=10)
+            await asyncio.gather(*[
+                buffer.add({'id': i, 'user_id': i % 2, 'amount': 250}) for i in range(6)
+            ])
+            return buffer
+        
+        with mock.patch.object(database.ydb_client, 'execute_query', mock.AsyncMock(return_value=[])) as execute:
+            buffer = asyncio.run(run())
+        
+        self.assertEqual(execute.await_count, 2)
+        query, params = execute.await_args.args
+        self.assertIn('AS_TABLE($rows)', query)
+        self.assertEqual(params['rows'][0], {'id': 3, 'user_id': 1, 'amount': 250.0})
+        self.assertEqual((buffer.flushes, buffer.rows_written), (2, 6))
+    
+    def test_read_your_writes_and_errors(self):
+        """Тест записи перед чтением и передачи ошибки вызвавшим"""
+        import asyncio
+        from unittest import mock
+        import database
+        
+        async def run():
+            buffer = database.WriteBehindBuffer('water_intake', self.COLUMNS, delay_seconds=10)
+            write = asyncio.ensure_future(buffer.add({'id': 1, 'user_id': 7, 'amount': 250}))
+            await asyncio.sleep(0)
+            await buffer.flush(user_id=8)
+            self.assertFalse(write.done())
+            await buffer.flush(user_id=7)
+            self.assertTrue(write.done())
+            return write
+        
+        with mock.patch.object(database.ydb_client, 'execute_query',
+                               mock.AsyncMock(side_effect=RuntimeError('unavailable'))):
+            write = asyncio.run(run())
+        with self.assertRaises(RuntimeError):
+            write.result()
+    
+    def test_cancelled_reader_does_not_cancel_batch(self):
+        """Тест: отмена ожидающего чтения не отменяет запись пакета"""
+        import asyncio
+        from unittest import mock
+        import database
+        
+        async def slow_execute(query, params):
+            await asyncio.sleep(0.05)
+            return []
+        
+        async def run():
+            buffer = database.WriteBehindBuffer('water_intake', self.COLUMNS, delay_seconds=10)
+            write = asyncio.ensure_future(buffer.add({'id': 1, 'user_id': 7, 'amount': 250}))
+            await asyncio.sleep(0)
+            reader = asyncio.ensure_future(buffer.flush(user_id=7))
+            await asyncio.sleep(0.01)
+            reader.cancel()
+            await write
+            return buffer
+        
+        with mock.patch.object(database.ydb_client, 'execute_query', side_effect=slow_execute):
+            buffer = asyncio.run(run())
+        self.assertEqual(buffer.rows_written, 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
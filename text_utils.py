@@ -0,0 +1,197 @@
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Окончания русских слов, от длинных к коротким
+_RU_ENDINGS = (
+    'иями', 'ями', 'ами', 'его', 'ого', 'ему', 'ому', 'ыми', 'ими',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ую', 'юю',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ей', 'ью',
+    'а', 'я', 'о', 'е', 'и', 'ы', 'у', 'ю', 'ь', 'й',
+)
+
+_MIN_STEM_LENGTH = 3
+
+_WORD_RE = re.compile(r'[a-zа-я0-9]+')
+
+# Процент жирности, спирта и т.п.: "3,2%" отличает продукт, а не его количество
+_PERCENT_RE = re.compile(r'(\d+)(?:[.,](\d+))?\s*%')
+_QUERY_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?%|[a-zа-я0-9]+')
+
+# Единицы количества и их вес в граммах (мл считаем равными граммам)
+UNIT_GRAMS = {
+    'г': 1, 'гр': 1, 'грамм': 1, 'грамма': 1, 'граммов': 1, 'g': 1,
+    'кг': 1000, 'килограмм': 1000, 'килограмма': 1000, 'килограммов': 1000, 'kg': 1000,
+    'мл': 1, 'ml': 1,
+    'л': 1000, 'литр': 1000, 'литра': 1000, 'литров': 1000, 'l': 1000,
+}
+
+_QUANTITY_RE = re.compile(
+    r'(\d+(?:[.,]\d+)?)\s*(?:(' + '|'.join(sorted(UNIT_GRAMS, key=len, reverse=True)) + r')\.?)?(?![a-zа-яё]|[\d.,]*\s*%)',
+    re.IGNORECASE
+)
+
+# Служебные слова, не влияющие на выбор продукта
+STOP_WORDS = frozenset({
+    'и', 'с', 'со', 'в', 'во', 'на', 'без', 'для', 'по', 'из', 'от', 'до', 'или',
+    'а', 'но', 'к', 'у', 'о', 'об', 'штук', 'шт', 'порция', 'порции',
+})
+
+
+def stem_ru(word: str) -> str:
+    """
+    Облегченный стеммер для русских названий продуктов
+
+    Отрезает одно падежное или родовое окончание, оставляя основу
+    не короче трех букв: "гречки" и "гречка" дают "гречк".
+    """
+    word = word.lower().replace('ё', 'е')
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def stemmed_words(text: str) -> list:
+    """Слова текста после приведения к нижнему регистру и стемминга"""
+    return [stem_ru(word) for word in _WORD_RE.findall(text.lower().replace('ё', 'е'))]
+
+
+def unit_grams(unit: Optional[str]) -> float:
+    """Сколько граммов в единице количества (без единицы - граммы)"""
+    return UNIT_GRAMS.get(unit.lower(), 1) if unit else 1
+
+
+def parse_quantity(text: str, default: float = 100) -> Tuple[float, str]:
+    """
+    Первое количество в тексте в граммах и текст без него
+
+    "200г гречки" -> (200.0, "гречки"), "1,5 кг яблок" -> (1500.0, "яблок").
+    Если количества нет - (default, исходный текст).
+    """
+    match = _QUANTITY_RE.search(text)
+    if not match:
+        return float(default), text.strip()
+
+    amount = float(match.group(1).replace(',', '.')) * unit_grams(match.group(2))
+    rest = text[:match.start()] + ' ' + text[match.end():]
+    return amount, ' '.join(rest.split())
+
+
+@lru_cache(maxsize=4096)
+def normalize_query(text: str) -> str:
+    """
+    Запрос к базе продуктов без лишнего: нижний регистр, ё -> е,
+    без количеств, единиц и служебных слов, с одиночными пробелами.
+    Проценты остаются в запросе в виде "3.2%".
+
+    "  ГРЕЧКА 200г " -> "гречка", "овсянка с молоком" -> "овсянка молоком",
+    "Молоко 3,2 %" -> "молоко 3.2%"
+    """
+    text = _QUANTITY_RE.sub(' ', text.lower().replace('ё', 'е'))
+    text = _PERCENT_RE.sub(lambda m: f" {m.group(1)}{'.' + m.group(2) if m.group(2) else ''}% ", text)
+    return ' '.join(word for word in _QUERY_TOKEN_RE.findall(text) if word not in STOP_WORDS)
+
+
+def number_tokens(text: str) -> FrozenSet[str]:
+    """
+    Числа, оставшиеся после нормализации запроса (проценты и т.п.)
+
+    Количества и единицы не учитываются: "Молоко 3,2% 930 мл" -> {"3.2%"}.
+    """
+    return frozenset(word for word in normalize_query(text).split() if any(char.isdigit() for char in word))
+
+
+@lru_cache(maxsize=4096)
+def query_key(text: str) -> str:
+    """
+    Ключ кэша для запроса: основы слов нормализованного запроса
+
+    "Гречка", "гречки" и "ГРЕЧКА 200г" дают один ключ "гречк".
+    """
+    normalized = normalize_query(text)
+    if not normalized:
+        return ' '.join(text.lower().split())
+    return ' '.join(stem_ru(word) for word in normalized.split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Множество символьных триграмм по основам слов (с отступами, как в pg_trgm)"""
+    grams = set()
+    for word in stemmed_words(text):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+
+class KeywordMatcher:
+    """
+    Поиск множества ключевых слов за один проход (автомат Ахо-Корасик)
+
+    Строится один раз из словаря метка -> ключевые слова; время разбора
+    текста линейно по его длине и не зависит от числа ключевых слов.
+    Ключевые слова ищутся как подстроки без учета регистра, как в
+    проверках вида `keyword in text.lower()`.
+    """
+
+    def __init__(self, keywords_by_label: Dict[str, Iterable[str]]):
+        self.labels_order = list(keywords_by_label)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+
+        for label, keywords in keywords_by_label.items():
+            for keyword in keywords:
+                self._add(keyword.lower(), label)
+        self._build_failure_links()
+
+    def _add(self, keyword: str, label: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword, label))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, str, str]]:
+        """Все вхождения: (позиция начала, ключевое слово, метка)"""
+        state = 0
+        for position, char in enumerate(text.lower()):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword, label in self._output[state]:
+                yield position - len(keyword) + 1, keyword, label
+
+    def labels(self, text: str) -> Set[str]:
+        """Метки всех найденных ключевых слов"""
+        return {label for _, _, label in self.find_all(text)}
+
+    def first_label(self, text: str) -> Optional[str]:
+        """Найденная метка, стоящая раньше всех в исходном словаре"""
+        found = self.labels(text)
+        return next((label for label in self.labels_order if label in found), None)
+
+    def last_label(self, text: str) -> Optional[str]:
+        """Найденная метка, стоящая в исходном словаре последней"""
+        found = self.labels(text)
+        return next((label for label in reversed(self.labels_order) if label in found), None)
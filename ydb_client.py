@@ -1,13 +1,72 @@
 import ydb
 import ydb.iam
+import weakref
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import config
 
+
+class PreparedQueryCache:
+    """
+    Подготовленные запросы по сессиям YDB: текст запроса -> DataQuery
+    
+    Подготовленный запрос живет только в своей сессии, поэтому кэш
+    ведется отдельно для каждой. Сессии хранятся по слабым ссылкам:
+    закрытая пулом сессия уходит из кэша вместе с ее запросами. Если
+    пул пересоздал сессию (сменился session_id) или запрос в ней
+    завершился ошибкой, запросы сессии подготавливаются заново.
+    """
+    
+    def __init__(self):
+        self._sessions = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def _queries(self, session) -> Dict[str, Any]:
+        session_id = session.session_id
+        cached = self._sessions.get(session)
+        if cached is None or cached[0] != session_id:
+            if cached is not None:
+                self.invalidations += 1
+            cached = (session_id, {})
+            self._sessions[session] = cached
+        return cached[1]
+    
+    def prepare(self, session, query: str):
+        """Подготовленный запрос из кэша сессии или новый session.prepare"""
+        queries = self._queries(session)
+        prepared_query = queries.get(query)
+        if prepared_query is not None:
+            self.hits += 1
+            return prepared_query
+        
+        self.misses += 1
+        prepared_query = session.prepare(query)
+        queries[query] = prepared_query
+        return prepared_query
+    
+    def invalidate(self, session):
+        """Забыть запросы сессии (после ошибки в ней)"""
+        if self._sessions.pop(session, None) is not None:
+            self.invalidations += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'sessions': len(self._sessions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
 class YDBClient:
     def __init__(self):
         self.driver = None
         self.pool = None
+        self.prepared = PreparedQueryCache()
         
     async def connect(self):
         """Подключение к YDB с правильными credentials"""
@@ -34,19 +93,24 @@ class YDBClient:
     async def execute_query(self, query: str, parameters: dict = None) -> List[Dict]:
         """Выполнить SQL-запрос"""
         async with self.pool.acquire() as session:
-            prepared_query = session.prepare(query)
-            
-            if parameters:
-                result = await session.transaction().execute(
-                    prepared_query,
-                    parameters,
-                    commit_tx=True
-                )
-            else:
-                result = await session.transaction().execute(
-                    prepared_query,
-                    commit_tx=True
-                )
+            try:
+                prepared_query = self.prepared.prepare(session, query)
+                
+                if parameters:
+                    result = await session.transaction().execute(
+                        prepared_query,
+                        parameters,
+                        commit_tx=True
+                    )
+                else:
+                    result = await session.transaction().execute(
+                        prepared_query,
+                        commit_tx=True
+                    )
+            except ydb.Error:
+                # Сессия могла быть сброшена сервером вместе с подготовленными запросами
+                self.prepared.invalidate(session)
+                raise
             
             return [dict(row) for row in result[0].rows]
     